@@ -6,7 +6,7 @@ async def main():
     
     # Print current context
     print("\nCurrent Context:")
-    await app.context_manager.update_llm_context(app.llm_service)
+    print(await app.context_manager.get_context_for_llm())
     
     # Test some context-aware questions
     questions = [
@@ -15,11 +15,11 @@ async def main():
         "Is it a good time for outdoor activities?"
     ]
     
-    for question in questions:
-        print(f"\nQuestion: {question}")
-        await app.context_manager.update_llm_context(app.llm_service)
-        response = app.llm_service.chat(question)
-        print(f"Response: {response}")
+    async with app:
+        for question in questions:
+            print(f"\nQuestion: {question}")
+            response = await app.process_message(question)
+            print(f"Response: {response}")
 
 if __name__ == "__main__":
     asyncio.run(main())
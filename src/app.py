@@ -1,29 +1,107 @@
-from .lib.context.manager import ContextManager
+import asyncio
+from typing import Optional, AsyncIterator
+from .lib.context.manager import ContextManager, Location
+from .lib.context.scheduler import ContextRefresher
 from .lib.ai.llm import LLMService
+from .lib.utils.cache import Cache, default_backend
+from .lib.utils.http import aclose_clients
 from .config.location import DEFAULT_LOCATION
 
 class Application:
-    def __init__(self):
-        # Initialize the context manager with default location
-        self.context_manager = ContextManager()
-        self.context_manager.location = DEFAULT_LOCATION
+    # Replies kept by the optional in-memory response cache
+    RESPONSE_CACHE_ENTRIES = 1024
+
+    def __init__(
+        self,
+        location: Location = DEFAULT_LOCATION,
+        context_token_budget: Optional[int] = None,
+        cache_responses: bool = False,
+        refresh_context: bool = True,
+        **llm_kwargs
+    ):
+        # Initialize the context manager with the user's location
+        self.context_manager = ContextManager(location, token_budget=context_token_budget)
+        
+        # Keeps the context sources and snapshot warm once the app is started
+        self.context_refresher = ContextRefresher(self.context_manager) if refresh_context else None
+        
+        # One response cache shared by every session; on disk when CACHE_DB_PATH is set
+        if cache_responses and 'response_cache' not in llm_kwargs:
+            llm_kwargs['response_cache'] = default_backend() or Cache(max_entries=self.RESPONSE_CACHE_ENTRIES)
         
-        # Initialize the LLM service
-        self.llm_service = LLMService()
+        # Initialize the LLM service for the default conversation
+        self._llm_kwargs = llm_kwargs
+        self.llm_service = LLMService(**llm_kwargs)
     
-    def process_message(self, message: str) -> str:
+    def create_session(self) -> LLMService:
+        """
+        Create an independent conversation that shares this application's
+        context sources and caches. Use one session per concurrent conversation.
+        """
+        return LLMService(**self._llm_kwargs)
+    
+    async def process_message(self, message: str, session: Optional[LLMService] = None) -> str:
         """
         Process a user message, updating context before each interaction.
+        
+        Args:
+            message: The user's message
+            session: Conversation to use (defaults to the application's own)
         """
-        # Update context before processing the message
-        self.context_manager.update_llm_context(self.llm_service)
+        llm_service = session or self.llm_service
+        
+        # Update context before processing the message, fetching only what it needs
+        await self.context_manager.update_llm_context(llm_service, message)
         
         # Get response from LLM
-        return self.llm_service.chat(message)
+        return await llm_service.achat(message)
+    
+    async def stream_message(self, message: str, session: Optional[LLMService] = None) -> AsyncIterator[str]:
+        """
+        Process a user message, yielding the response text as it is generated.
+        
+        Args:
+            message: The user's message
+            session: Conversation to use (defaults to the application's own)
+        """
+        llm_service = session or self.llm_service
+        await self.context_manager.update_llm_context(llm_service, message)
+        async for delta in llm_service.astream_chat(message):
+            yield delta
+    
+    def process_message_sync(self, message: str, session: Optional[LLMService] = None) -> str:
+        """Blocking wrapper around process_message for scripts."""
+        async def run() -> str:
+            try:
+                return await self.process_message(message, session)
+            finally:
+                # Pooled clients are bound to this call's event loop, which
+                # ends with it; close them rather than leak their connections
+                await aclose_clients()
+        return asyncio.run(run())
     
     def reset_conversation(self):
         """Reset the conversation history."""
         self.llm_service.reset_conversation()
 
+    def start(self):
+        """Start refreshing context in the background on the running event loop."""
+        if self.context_refresher is not None:
+            self.context_refresher.start()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """Stop background refreshes and release upstream connections held
+        by the context sources."""
+        if self.context_refresher is not None:
+            await self.context_refresher.stop()
+        await self.context_manager.aclose()
+
 # Create a singleton instance
 app = Application()
@@ -1,65 +1,475 @@
-from typing import Optional, List, Union
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from dataclasses import dataclass
+from typing import Any, Optional, List, Union, AsyncIterator, Dict, Tuple, Sequence
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, BaseMessage, message_chunk_to_message
 from langchain_core.language_models import BaseChatModel
-from langchain_anthropic import ChatAnthropic
-from langchain_openai import ChatOpenAI
+import asyncio
 import os
+import re
+import threading
+import time
 from dotenv import load_dotenv
+from ..utils.cache import CacheBackend, fingerprint
+from ..utils.metrics import registry
+from ..utils.tokens import count_tokens
+from .memory import ConversationMemory
 
 # Load environment variables
 load_dotenv('.env.local')
 
 class LLMFactory:
+    """Creates model clients, reusing one per (provider, model, options).
+
+    Chat model clients hold no conversation state, so every LLMService with
+    the same settings shares one, along with its HTTP connection pool.
+    Options that aren't plain data (HTTP clients, callback handlers) are
+    matched by identity, so only services passing the same object share.
+    Provider SDKs are imported on first use, so only the ones in use load.
+    """
+
+    _clients: Dict[Tuple[str, str, Any], BaseChatModel] = {}
+    _lock = threading.Lock()
+
     @staticmethod
-    def create_llm(model_name: str, **kwargs) -> BaseChatModel:
-        """Create an LLM instance based on the model name."""
+    def provider(model_name: str) -> str:
+        """Get the provider serving a model."""
         if model_name.startswith('gpt'):
+            return 'openai'
+        elif model_name.startswith('claude'):
+            return 'anthropic'
+        else:
+            raise ValueError(f"Unsupported model: {model_name}")
+
+    @classmethod
+    def _options_key(cls, value: Any) -> Any:
+        """Hashable key for a client option: plain data by value, anything
+        else by identity (the shared client keeps the object alive)"""
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        if isinstance(value, (list, tuple)):
+            return (type(value).__name__, *(cls._options_key(item) for item in value))
+        if isinstance(value, dict):
+            return ('dict', *sorted((str(k), cls._options_key(v)) for k, v in value.items()))
+        return ('id', id(value))
+
+    @staticmethod
+    def _build(provider: str, model_name: str, **kwargs) -> BaseChatModel:
+        if provider == 'openai':
+            from langchain_openai import ChatOpenAI
             return ChatOpenAI(
                 model=model_name,
                 openai_api_key=os.getenv('OPENAI_API_KEY'),
                 **kwargs
             )
-        elif model_name.startswith('claude'):
-            return ChatAnthropic(
-                model=model_name,
-                anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
-                **kwargs
-            )
-        else:
-            raise ValueError(f"Unsupported model: {model_name}")
+        from langchain_anthropic import ChatAnthropic
+        return ChatAnthropic(
+            model=model_name,
+            anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
+            **kwargs
+        )
+
+    @classmethod
+    def create_llm(cls, model_name: str, **kwargs) -> BaseChatModel:
+        """Get the shared LLM instance for the model name and options."""
+        provider = cls.provider(model_name)
+        key = (provider, model_name, cls._options_key(kwargs))
+        with cls._lock:
+            llm = cls._clients.get(key)
+            if llm is None:
+                llm = cls._clients[key] = cls._build(provider, model_name, **kwargs)
+            return llm
+
+    @classmethod
+    def clear(cls) -> None:
+        """Drop the shared clients; later calls create new ones."""
+        with cls._lock:
+            cls._clients.clear()
+
+LLM_RESPONSE_CACHE = registry.counter(
+    'llm_response_cache_total',
+    'Response cache lookups by result (hit or miss)'
+)
+LLM_TIME_TO_FIRST_TOKEN = registry.histogram(
+    'llm_time_to_first_token_seconds',
+    'Seconds from sending a streamed request to its first token'
+)
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    'llm_output_tokens_per_second',
+    'Output tokens per second after the first token of a streamed response',
+    buckets=(5, 10, 20, 40, 60, 80, 120, 160, 240, 320)
+)
+
+# Punctuation ending a sentence or clause; punctuation inside a token
+# ("2+2", "3.5", "c++") is kept so different questions stay distinct
+_SENTENCE_PUNCTUATION = re.compile(r"[.,;:!?]+(?=\s|$)")
+
+def normalize_message(message: str) -> str:
+    """Fold case, whitespace and sentence punctuation so near-identical questions match."""
+    return " ".join(_SENTENCE_PUNCTUATION.sub("", message.lower()).split())
+
+def _text(content: Union[str, list]) -> str:
+    """Get the text of message content, which may be a list of blocks."""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for your own later reference. Keep names, "
+    "facts, preferences, decisions and open questions; leave out pleasantries. "
+    "If an earlier summary is given, merge it into the new one."
+)
+
+# Marks the end of a prompt prefix Anthropic should cache
+CACHE_CONTROL = {"type": "ephemeral"}
+
+def _with_cache_control(message: BaseMessage) -> BaseMessage:
+    """Copy a message with a cache breakpoint on its last content block."""
+    if isinstance(message.content, str):
+        blocks = [{"type": "text", "text": message.content}]
+    else:
+        blocks = [block if isinstance(block, dict) else {"type": "text", "text": block} for block in message.content]
+    blocks[-1] = {**blocks[-1], "cache_control": CACHE_CONTROL}
+    return message.model_copy(update={"content": blocks})
+
+@dataclass
+class BatchResult:
+    """Outcome of one prompt in LLMService.abatch."""
+    prompt: str
+    response: Optional[str] = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
 class LLMService:
     def __init__(
         self,
         model_name: str = "gpt-3.5-turbo",
         system_prompt: Optional[str] = None,
+        stable_prefix: bool = False,
+        max_turns: Optional[int] = None,
+        response_cache: Optional[CacheBackend] = None,
+        response_cache_ttl: int = 300,
         **kwargs
     ):
+        """
+        Initialize the service.
+
+        Args:
+            model_name: Model to use; the provider is picked from its name
+            system_prompt: Optional system prompt opening the conversation
+            stable_prefix: Keep the context out of the conversation history and
+                send it just before the latest message, so the system prompt
+                and earlier turns form a prefix the provider can cache. For
+                Claude models cache breakpoints are set on that prefix.
+            max_turns: Keep only this many recent turns verbatim and fold
+                older ones into a running summary, produced in the background
+                after a reply. None keeps the whole conversation.
+            response_cache: Cache (in memory or SQLiteCache on disk) for
+                replies, keyed on the model, system prompt, context version
+                and normalized message; may be shared by sessions. Only used
+                for the first turn of a conversation (or after a reset),
+                whose reply can't depend on earlier turns.
+            response_cache_ttl: Longest a cached reply is served, further
+                limited by how long the context it was based on stays fresh
+            **kwargs: Passed to the model client
+        """
         self.llm = LLMFactory.create_llm(model_name, **kwargs)
+        self.model_name = model_name
         self.system_prompt = system_prompt
-        self.conversation_history: List[Union[SystemMessage, HumanMessage, AIMessage]] = []
-        if system_prompt:
-            self.conversation_history.append(SystemMessage(content=system_prompt))
-
-    def add_context_message(self, context: str) -> None:
-        """Add a context message to the conversation history."""
-        # Remove any previous context messages
-        self.conversation_history = [
-            msg for msg in self.conversation_history 
-            if not (isinstance(msg, SystemMessage) and msg.content.startswith("Here is the current context"))
+        self.stable_prefix = stable_prefix
+        self.context: Optional[str] = None
+        self.context_version: Optional[str] = None
+        self._context_expires_at: Optional[float] = None
+        self.response_cache = response_cache
+        self.response_cache_ttl = response_cache_ttl
+        self.memory = ConversationMemory(system_prompt, max_turns)
+        self._summary_task: Optional[asyncio.Task] = None
+
+    @property
+    def conversation_history(self) -> List[Union[SystemMessage, HumanMessage, AIMessage]]:
+        return self.memory.messages
+
+    def add_context_message(self, context: str, version: Optional[str] = None, expires_in: Optional[float] = None) -> None:
+        """
+        Add a context message to the conversation history.
+
+        Args:
+            context: The context text
+            version: Identifies the context's content for the response cache
+                (defaults to a hash of the text)
+            expires_in: Seconds the context stays fresh; cached replies based
+                on it expire no later than this
+        """
+        self.context = context
+        self.context_version = version or fingerprint(context)
+        self._context_expires_at = None if expires_in is None else time.monotonic() + expires_in
+        if self.stable_prefix:
+            # Sent in a fixed slot by _prompt_messages instead
+            return
+
+        # Replace any previous context message
+        self.memory.set_context(SystemMessage(content=context))
+
+    @staticmethod
+    def _summary_request(previous: Optional[str], messages: List[BaseMessage]) -> List[BaseMessage]:
+        transcript = "\n".join(
+            f"{'User' if isinstance(message, HumanMessage) else 'Assistant'}: {_text(message.content)}"
+            for message in messages
+            if isinstance(message, (HumanMessage, AIMessage))
+        )
+        earlier = f"Earlier summary:\n{previous}\n\n" if previous else ""
+        return [
+            SystemMessage(content=SUMMARY_PROMPT),
+            HumanMessage(content=f"{earlier}Conversation:\n{transcript}")
         ]
-        # Add the new context message
-        self.conversation_history.append(SystemMessage(content=context))
+
+    def _summarize_sync(self) -> None:
+        """Fold overflowing turns into the summary before returning (sync callers)."""
+        folded = self.memory.pending_fold()
+        if not folded:
+            return
+        try:
+            response = self.llm.invoke(self._summary_request(self.memory.summary, folded))
+        except Exception as e:
+            print(f"Error summarizing conversation: {e}")
+            return
+        self.memory.fold(folded, _text(response.content), self.memory.generation)
+
+    def _schedule_summary(self) -> None:
+        """Fold overflowing turns into the summary in the background."""
+        if self._summary_task is not None and not self._summary_task.done():
+            return
+        folded = self.memory.pending_fold()
+        if not folded:
+            return
+
+        generation = self.memory.generation
+
+        async def summarize():
+            try:
+                response = await self.llm.ainvoke(self._summary_request(self.memory.summary, folded))
+            except Exception as e:
+                print(f"Error summarizing conversation: {e}")
+                return
+            self.memory.fold(folded, _text(response.content), generation)
+
+        self._summary_task = asyncio.get_running_loop().create_task(summarize())
+
+    def _prompt_messages(self) -> List[BaseMessage]:
+        """
+        Get the messages to send for the current turn.
+
+        In stable-prefix mode the layout is system prompt, earlier turns,
+        context, latest message: everything before the context is unchanged
+        from the previous turn apart from the turn appended to it.
+        """
+        history = self.conversation_history
+        if not self.stable_prefix:
+            return history
+
+        prefix, latest = history[:-1], history[-1]
+        anthropic = self.model_name.startswith('claude')
+        if anthropic and prefix:
+            # Breakpoints after the system prompt and after the earlier turns
+            prefix = list(prefix)
+            prefix[-1] = _with_cache_control(prefix[-1])
+            if len(prefix) > 1 and isinstance(prefix[0], SystemMessage):
+                prefix[0] = _with_cache_control(prefix[0])
+
+        if self.context is None:
+            return [*prefix, latest]
+        if anthropic:
+            # Anthropic only accepts system content at the start, so the
+            # context rides in the latest user turn ahead of the message
+            content = latest.content if isinstance(latest.content, list) else [{"type": "text", "text": latest.content}]
+            return [*prefix, HumanMessage(content=[{"type": "text", "text": self.context}, *content])]
+        return [*prefix, SystemMessage(content=self.context), latest]
+
+    def _response_key(self, message: str) -> Optional[str]:
+        # The key leaves out the history, so a reply that may depend on
+        # earlier turns is neither served from nor added to the cache
+        if self.response_cache is None or self.memory.has_turns:
+            return None
+        return "llm.response:" + fingerprint(
+            [self.model_name, self.system_prompt, self.context_version, normalize_message(message)]
+        )
+
+    def _record_lookup(self, message: str, content: Optional[str]) -> Optional[str]:
+        """Count a response cache lookup, recording the turn on a hit."""
+        LLM_RESPONSE_CACHE.inc(result="miss" if content is None else "hit")
+        if content is not None:
+            self.conversation_history.append(HumanMessage(content=message))
+            self.conversation_history.append(AIMessage(content=content))
+        return content
+
+    def _cached_response(self, key: Optional[str], message: str) -> Optional[str]:
+        """Answer from the response cache, recording the turn on a hit."""
+        if key is None:
+            return None
+        return self._record_lookup(message, self.response_cache.get(key))
+
+    async def _acached_response(self, key: Optional[str], message: str) -> Optional[str]:
+        """_cached_response without blocking the event loop on a disk cache."""
+        if key is None:
+            return None
+        return self._record_lookup(message, await self.response_cache.aget(key))
+
+    def _response_ttl(self) -> float:
+        ttl = self.response_cache_ttl
+        if self._context_expires_at is not None:
+            ttl = min(ttl, self._context_expires_at - time.monotonic())
+        return ttl
+
+    def _store_response(self, key: Optional[str], content: Union[str, list]) -> None:
+        ttl = self._response_ttl()
+        if key is not None and ttl > 0:
+            self.response_cache.set(key, _text(content), ttl)
+
+    async def _astore_response(self, key: Optional[str], content: Union[str, list]) -> None:
+        ttl = self._response_ttl()
+        if key is not None and ttl > 0:
+            await self.response_cache.aset(key, _text(content), ttl)
+
+    def _drop_unanswered(self, human: HumanMessage) -> None:
+        """Remove a user turn that got no reply, keeping turns paired."""
+        if self.conversation_history and self.conversation_history[-1] is human:
+            self.conversation_history.pop()
 
     def chat(self, message: str) -> str:
         """Send a message and get a response."""
-        self.conversation_history.append(HumanMessage(content=message))
-        response = self.llm.invoke(self.conversation_history)
+        key = self._response_key(message)
+        cached = self._cached_response(key, message)
+        if cached is not None:
+            return cached
+
+        human = HumanMessage(content=message)
+        self.conversation_history.append(human)
+        try:
+            response = self.llm.invoke(self._prompt_messages())
+        except BaseException:
+            self._drop_unanswered(human)
+            raise
+        self.conversation_history.append(response)
+        self._store_response(key, response.content)
+        self._summarize_sync()
+        return response.content
+
+    async def achat(self, message: str) -> str:
+        """Send a message and get a response without blocking the event loop."""
+        key = self._response_key(message)
+        cached = await self._acached_response(key, message)
+        if cached is not None:
+            return cached
+
+        human = HumanMessage(content=message)
+        self.conversation_history.append(human)
+        try:
+            response = await self.llm.ainvoke(self._prompt_messages())
+        except BaseException:
+            self._drop_unanswered(human)
+            raise
         self.conversation_history.append(response)
+        await self._astore_response(key, response.content)
+        self._schedule_summary()
         return response.content
 
+    async def astream_chat(self, message: str) -> AsyncIterator[str]:
+        """
+        Send a message and yield the response text as it is generated.
+
+        The complete response is added to the conversation history once the
+        stream finishes. If the caller stops early or the stream fails, the
+        text received so far is kept as the reply, or the user turn is
+        dropped if nothing arrived. Time to first token and output tokens per second are
+        recorded in the metrics registry.
+        """
+        key = self._response_key(message)
+        cached = await self._acached_response(key, message)
+        if cached is not None:
+            yield cached
+            return
+
+        human = HumanMessage(content=message)
+        self.conversation_history.append(human)
+        start = time.perf_counter()
+        first_token_at = None
+        response = None
+        try:
+            async for chunk in self.llm.astream(self._prompt_messages()):
+                response = chunk if response is None else response + chunk
+                delta = _text(chunk.content)
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    LLM_TIME_TO_FIRST_TOKEN.observe(first_token_at - start, model=self.model_name)
+                yield delta
+        finally:
+            # Runs on early exit too (aclose or an error), so every user
+            # turn in the history is followed by a reply
+            if response is None:
+                self._drop_unanswered(human)
+            else:
+                response = message_chunk_to_message(response)
+                self.conversation_history.append(response)
+
+        if response is None:
+            return
+        await self._astore_response(key, response.content)
+        self._schedule_summary()
+
+        if first_token_at is not None:
+            elapsed = time.perf_counter() - first_token_at
+            usage = getattr(response, 'usage_metadata', None)
+            tokens = usage['output_tokens'] if usage else count_tokens(_text(response.content))
+            if elapsed > 0:
+                LLM_TOKENS_PER_SECOND.observe(tokens / elapsed, model=self.model_name)
+
+    async def abatch(self, prompts: Sequence[str], max_concurrency: int = 8) -> List[BatchResult]:
+        """
+        Answer independent single-turn prompts concurrently.
+
+        Each prompt is sent on its own with the system prompt and current
+        context, outside the conversation history, which is left untouched.
+
+        Args:
+            prompts: The prompts to answer
+            max_concurrency: Most requests in flight at once
+
+        Returns:
+            One result per prompt, in input order; a failed prompt carries its
+            error instead of failing the batch
+        """
+        # One system message: Anthropic rejects a second one
+        system = [text for text in (self.system_prompt, self.context) if text]
+        prefix: List[BaseMessage] = []
+        if system and self.model_name.startswith('claude'):
+            # Every request in the batch shares this prefix
+            prefix.append(_with_cache_control(SystemMessage(
+                content=[{"type": "text", "text": text} for text in system]
+            )))
+        elif system:
+            prefix.append(SystemMessage(content="\n\n".join(system)))
+
+        responses = await self.llm.abatch(
+            [[*prefix, HumanMessage(content=prompt)] for prompt in prompts],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True
+        )
+        return [
+            BatchResult(prompt, error=response) if isinstance(response, BaseException)
+            else BatchResult(prompt, response=_text(response.content))
+            for prompt, response in zip(prompts, responses)
+        ]
+
     def reset_conversation(self):
         """Reset the conversation history, keeping the system prompt if it exists."""
-        self.conversation_history = []
-        if self.system_prompt:
-            self.conversation_history.append(SystemMessage(content=self.system_prompt))
+        self.memory.reset()
+        self.context = None
+        self.context_version = None
+        self._context_expires_at = None
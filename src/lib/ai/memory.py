@@ -0,0 +1,130 @@
+"""
+Conversation memory with a bounded verbatim window.
+
+Keeps the system prompt, a running summary of older turns, the most recent
+turns verbatim and at most one context message. The summary shares the
+leading system message with the system prompt, since Anthropic only
+accepts system content at the start of the conversation. Older turns are handed out
+to be summarized and folded into the summary once the window overflows, so
+the prompt stays roughly the same size however long the conversation runs.
+"""
+from typing import List, Optional
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+class ConversationMemory:
+    """Message list for one conversation.
+
+    Layout: one system message holding the system prompt and the summary
+    (when there is either), then the turns, with the context message
+    wherever it was last set. The context message's position is tracked, so
+    replacing it doesn't scan the history.
+    """
+
+    # Extra turns allowed past max_turns before older ones are folded, so a
+    # summary isn't requested on every turn
+    FOLD_BATCH = 4
+
+    def __init__(self, system_prompt: Optional[str] = None, max_turns: Optional[int] = None):
+        """
+        Initialize the memory.
+
+        Args:
+            system_prompt: Optional system prompt opening the conversation
+            max_turns: User turns (with their replies) kept verbatim; older
+                ones are folded into the summary. None keeps everything.
+        """
+        self.system_prompt = system_prompt
+        self.max_turns = max_turns
+        # Bumped on reset so a summary of the old conversation is discarded
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        """Forget everything except the system prompt."""
+        self.messages: List[BaseMessage] = []
+        self.summary: Optional[str] = None
+        self._context_index: Optional[int] = None
+        self.generation += 1
+        head = self._head()
+        if head is not None:
+            self.messages.append(head)
+
+    def _head(self) -> Optional[SystemMessage]:
+        """The leading system message: system prompt, then summary."""
+        parts = [self.system_prompt] if self.system_prompt else []
+        if self.summary is not None:
+            parts.append(SUMMARY_PREFIX + self.summary)
+        return SystemMessage(content="\n\n".join(parts)) if parts else None
+
+    @property
+    def _turns_start(self) -> int:
+        return 1 if self.system_prompt or self.summary is not None else 0
+
+    @property
+    def has_turns(self) -> bool:
+        """Whether any turn has been recorded since the last reset, verbatim
+        or folded into the summary"""
+        return self.summary is not None or any(
+            isinstance(message, HumanMessage) for message in self.messages[self._turns_start:]
+        )
+
+    def append(self, message: BaseMessage):
+        self.messages.append(message)
+
+    def set_context(self, message: SystemMessage):
+        """Replace the context message, moving it to the end."""
+        if self._context_index is not None:
+            # The context sits a turn or so from the end, so this is cheap
+            del self.messages[self._context_index]
+        self.messages.append(message)
+        self._context_index = len(self.messages) - 1
+
+    def pending_fold(self) -> List[BaseMessage]:
+        """
+        Get the oldest turns to fold into the summary, if the verbatim window
+        has overflowed. Pass them with a summary to fold().
+        """
+        if self.max_turns is None:
+            return []
+
+        start = self._turns_start
+        end = len(self.messages) if self._context_index is None else self._context_index
+        human = [
+            i for i in range(start, end)
+            if isinstance(self.messages[i], HumanMessage)
+        ]
+        if len(human) <= self.max_turns + self.FOLD_BATCH:
+            return []
+        # Keep the latest max_turns user turns (counting the one after the context)
+        keep = max(0, self.max_turns - (0 if self._context_index is None else 1))
+        cut = human[len(human) - keep] if keep else end
+        return self.messages[start:cut]
+
+    def fold(self, folded: List[BaseMessage], summary: str, generation: int) -> bool:
+        """
+        Replace folded turns, as returned by pending_fold(), with summary.
+
+        Returns:
+            False if the conversation was reset or the turns already folded
+        """
+        start = self._turns_start
+        current = self.messages[start:start + len(folded)]
+        if generation != self.generation or len(current) != len(folded) or any(
+            a is not b for a, b in zip(current, folded)
+        ):
+            return False
+
+        del self.messages[start:start + len(folded)]
+        shift = -len(folded)
+        self.summary = summary
+        if start:
+            self.messages[0] = self._head()
+        else:
+            self.messages.insert(0, self._head())
+            shift += 1
+        if self._context_index is not None:
+            self._context_index += shift
+        return True
@@ -6,6 +6,11 @@ from typing import List, Optional, Dict, Any
 import os
 import httpx
 from ..utils.cache import cached
+from ..utils.circuit_breaker import circuit_breaker
+from ..utils.rate_limit import rate_limited, quota_group, observe_response
+from ..utils.http import get_client
+from ..utils.http_cache import note_freshness
+from ..utils.resilience import RetryPolicy
 
 @dataclass
 class PerplexityConfig:
@@ -27,6 +32,11 @@ class PerplexityClient:
     """Client for interacting with Perplexity AI API."""
     
     API_URL = "https://api.perplexity.ai/chat/completions"
+    # Online search completions routinely take several seconds
+    TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+    # Each request is billed, even one that times out on our side, so it
+    # is never retried or hedged
+    RETRY_POLICY = RetryPolicy(name='perplexity', attempt_timeout=20.0, idempotent=False)
     
     def __init__(self, api_key: Optional[str] = None):
         """Initialize the Perplexity client.
@@ -37,6 +47,7 @@ class PerplexityClient:
         self.api_key = api_key or os.getenv("PERPLEXITY_API_KEY")
         if not self.api_key:
             raise ValueError("Perplexity API key not found. Please set PERPLEXITY_API_KEY environment variable.")
+        self.quota_group = quota_group('perplexity', self.api_key)
     
     def _get_headers(self) -> Dict[str, str]:
         """Get headers for API requests."""
@@ -60,6 +71,8 @@ class PerplexityClient:
         return messages
     
     @cached(ttl_seconds=300)  # Cache responses for 5 minutes
+    @circuit_breaker('perplexity')
+    @rate_limited(max_requests=50, time_window=60, group=lambda client, *args, **kwargs: client.quota_group, adaptive=True)
     async def search(
         self,
         query: str,
@@ -101,15 +114,21 @@ class PerplexityClient:
         if config.max_tokens:
             payload["max_tokens"] = config.max_tokens
         
-        async with httpx.AsyncClient() as client:
+        async def complete():
+            client = get_client(self.API_URL)
             response = await client.post(
                 self.API_URL,
                 json=payload,
-                headers=self._get_headers()
+                headers=self._get_headers(),
+                timeout=self.TIMEOUT
             )
+            observe_response(self.quota_group, response)
             response.raise_for_status()
+            note_freshness(response)
             return response.json()
 
+        return await self.RETRY_POLICY.run(complete)
+
     async def ask(
         self,
         question: str,
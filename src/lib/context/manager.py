@@ -1,12 +1,20 @@
 from datetime import datetime
-from typing import Optional, Dict, Any, Tuple, List
-from dataclasses import dataclass
+from enum import Enum
+from typing import Optional, Dict, Any, Tuple, List, Callable
+from dataclasses import dataclass, field, replace
 from zoneinfo import ZoneInfo
+import asyncio
 import json
+import time
+import weakref
 from ..weather.client import WeatherClient
 from ..weather.allergy import AllergyClient
 from ..news import NewsClient
 from ..ai.perplexity import PerplexityClient, PerplexityConfig
+from ..utils.http import aclose_clients
+from ..utils.cache import fingerprint
+from ..utils.tokens import count_tokens, truncate_to_tokens
+from .relevance import ContextPlan, RelevanceGate
 
 @dataclass
 class Location:
@@ -17,15 +25,132 @@ class Location:
     country: str
     timezone: str
 
+class SectionStatus(str, Enum):
+    FRESH = "fresh"
+    STALE = "stale"
+    MISSING = "missing"
+
+@dataclass
+class ContextResult:
+    """Assembled context text and how each section was obtained."""
+    text: str
+    sections: Dict[str, SectionStatus] = field(default_factory=dict)
+    # The text without the leading current-time line
+    body: str = ""
+    # Sections added, removed or changed since the same consumer's
+    # previous turn (set by update_llm_context)
+    changed: List[str] = field(default_factory=list)
+    # Sections shortened or left out to fit the token budget
+    trimmed: List[str] = field(default_factory=list)
+    # Full (name, header, text) of every rendered section, in display order
+    parts: List[Tuple[str, Optional[str], str]] = field(default_factory=list)
+    # Location the sections were fetched for
+    location: Optional[Location] = None
+
+    @property
+    def has_changes(self) -> bool:
+        """Whether any section changed since the consumer's previous turn."""
+        return bool(self.changed)
+
+    def with_status(self, status: SectionStatus) -> List[str]:
+        """Names of the sections that have the given status."""
+        return [name for name, section_status in self.sections.items() if section_status == status]
+
+class SectionMemo:
+    """Last rendering of a context section and the payload it came from."""
+
+    def __init__(self):
+        self._parts: Optional[Tuple[Any, ...]] = None
+        self._fingerprint: Optional[str] = None
+        self._text: Optional[str] = None
+
+    def render(self, parts: Tuple[Any, ...], render: Callable[..., str]) -> str:
+        """
+        Render parts, reusing the previous text when they are unchanged.
+
+        Cached payloads are usually the very same objects turn after turn, so
+        identity is checked first; a content fingerprint catches equal payloads
+        that were rebuilt (e.g. decoded from a shared cache).
+        """
+        if self._parts is not None and len(parts) == len(self._parts) and all(
+            a is b for a, b in zip(parts, self._parts)
+        ):
+            return self._text
+
+        digest = fingerprint(parts)
+        if digest != self._fingerprint:
+            self._text = render(*parts)
+            self._fingerprint = digest
+        self._parts = parts
+        return self._text
+
 class ContextManager:
-    def __init__(self, location: Location):
-        """Initialize the context manager with a location."""
+    # Seconds each section may take before it is served stale or left out
+    SECTION_DEADLINES = {
+        'weather': 2.0,
+        'air_quality': 2.0,
+        'pollen': 2.0,
+        'news': 3.0,
+        'web_search': 6.0,
+    }
+    # Overall seconds a turn may spend assembling context
+    TURN_BUDGET = 6.0
+    NEWS_CATEGORIES = ['austin', 'latest', 'us', 'world']
+    STORIES_PER_CATEGORY = 3
+    # A pre-rendered snapshot older than this is rebuilt on the request path
+    SNAPSHOT_MAX_AGE = 600.0
+    # Order in which sections claim the token budget (lowest first)
+    SECTION_PRIORITIES = {
+        'weather': 0,
+        'web_search': 1,
+        'air_quality': 2,
+        'news': 3,
+        'pollen': 4,
+    }
+    # Smallest useful remainder of a truncated section, in tokens
+    MIN_SECTION_TOKENS = 24
+
+    def __init__(self, location: Location, token_budget: Optional[int] = None):
+        """
+        Initialize the context manager.
+
+        Args:
+            location: The user's location
+            token_budget: Maximum context tokens per turn; lower-priority
+                sections are shortened or dropped to fit (None for no limit)
+        """
         self._location = location
         self._weather_client = WeatherClient()
         self._allergy_client = AllergyClient()
         self._news_client = NewsClient()
         self._perplexity_client = PerplexityClient()
+        # Last successful rendering of each section and what it was fetched
+        # for (location, news categories, search query); served when a build
+        # for the same thing is late
+        self._last_sections: Dict[str, Tuple[Any, str]] = {}
+        # Sections each conversation was last sent, to report what changed
+        self._sent_sections = weakref.WeakKeyDictionary()
+        # Memoized section renderings keyed on their source payloads
+        self._section_memos: Dict[str, SectionMemo] = {}
+        # Shorter renderings of the latest sections, used to fit a token budget
+        self._compact_sections: Dict[str, str] = {}
+        # Maximum context tokens per turn, or None for no limit
+        self.token_budget = token_budget
+        self._relevance_gate = RelevanceGate(self.NEWS_CATEGORIES)
+        # Pre-rendered context kept warm by a ContextRefresher
+        self._snapshot: Optional[ContextResult] = None
+        self._snapshot_at: Optional[float] = None
         
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the pooled upstream HTTP connections."""
+        await aclose_clients()
+
     @property
     def location(self) -> Optional[Location]:
         return self._location
@@ -33,6 +158,9 @@ class ContextManager:
     @location.setter
     def location(self, value: Location):
         self._location = value
+        # The snapshot describes the old location
+        self._snapshot = None
+        self._snapshot_at = None
     
     def get_current_time(self) -> datetime:
         """Get the current time in the user's timezone."""
@@ -53,12 +181,50 @@ class ContextManager:
             print(f"Error fetching weather: {e}")
             return None
     
+    @staticmethod
+    def _stale_age(fetch, *args, **kwargs) -> Optional[float]:
+        """Age of the data a bound client method serves for these arguments
+        while its source is failing, or None when it is healthy."""
+        return fetch.stale_age(fetch.__self__, *args, **kwargs)
+
+    @staticmethod
+    def _staleness_note(age: Optional[float]) -> str:
+        """Describe the age of the data served for a failing source, if any."""
+        if age is None:
+            return ""
+        return f"(Source currently unavailable; showing data from {round(age / 60)} minutes ago)"
+
+    def _memoized(self, section: str, parts: Tuple[Any, ...], render: Callable[..., str]) -> str:
+        """Render a section, reusing the previous text if its inputs are unchanged."""
+        memo = self._section_memos.get(section)
+        if memo is None:
+            memo = self._section_memos[section] = SectionMemo()
+        return memo.render(parts, render)
+
     async def _get_air_quality_context(self, location: Tuple[float, float]) -> str:
         """Get air quality context for the given location."""
         data = await self._allergy_client.get_air_quality(location[0], location[1])
         if not data:
+            self._compact_sections.pop('air_quality', None)
             return "Air quality data is currently unavailable."
 
+        context = self._memoized('air_quality', (data,), self._render_air_quality)
+        compact = self._memoized('air_quality:compact', (data,), self._render_air_quality_compact)
+        staleness = self._staleness_note(
+            self._stale_age(self._allergy_client.get_air_quality, location[0], location[1])
+        )
+        self._compact_sections['air_quality'] = f"{compact}\n{staleness}" if staleness else compact
+        return f"{context}\n{staleness}" if staleness else context
+
+    @staticmethod
+    def _render_air_quality_compact(data: Dict[str, Any]) -> str:
+        return "\n".join(
+            f"AQI ({index['code'].upper()}): {index['aqi']} - {index['category']}"
+            for index in data.get('indexes', [])[:1]
+        )
+
+    @staticmethod
+    def _render_air_quality(data: Dict[str, Any]) -> str:
         context_parts = []
         
         # Add AQI information
@@ -90,8 +256,28 @@ class ContextManager:
         """Get pollen forecast context for the given location."""
         data = await self._allergy_client.get_pollen_forecast(location[0], location[1], days=1)
         if not data or not data.get('dailyInfo'):
+            self._compact_sections.pop('pollen', None)
             return "Pollen forecast is currently unavailable."
 
+        context = self._memoized('pollen', (data,), self._render_pollen)
+        compact = self._memoized('pollen:compact', (data,), self._render_pollen_compact)
+        staleness = self._staleness_note(
+            self._stale_age(self._allergy_client.get_pollen_forecast, location[0], location[1], days=1)
+        )
+        self._compact_sections['pollen'] = f"{compact}\n{staleness}" if staleness else compact
+        return f"{context}\n{staleness}" if staleness else context
+
+    @staticmethod
+    def _render_pollen_compact(data: Dict[str, Any]) -> str:
+        levels = [
+            f"{pollen_type['displayName']}: {pollen_type['indexInfo'].get('category', 'Unknown')}"
+            for pollen_type in data['dailyInfo'][0].get('pollenTypeInfo', [])
+            if pollen_type.get('indexInfo')
+        ]
+        return "Pollen levels: " + ", ".join(levels) if levels else ""
+
+    @staticmethod
+    def _render_pollen(data: Dict[str, Any]) -> str:
         context_parts = []
         today = data['dailyInfo'][0]
         
@@ -144,34 +330,62 @@ class ContextManager:
                 limit_per_category=stories_per_category
             )
             if not news_data:
+                self._compact_sections.pop('news', None)
                 return "News data is currently unavailable."
 
-            context_parts = []
-            
-            for category, articles in news_data.items():
-                if articles:
-                    context_parts.append(f"\n{category.title()} News (Top {stories_per_category}):")
-                    for i, article in enumerate(articles, 1):
-                        # Format publish time
-                        time_str = article.published.strftime('%I:%M %p').lstrip('0')
-                        
-                        # Add numbered title and timestamp
-                        context_parts.append(f"{i}. [{time_str}] {article.title}")
-                        
-                        # Add summary if requested
-                        if include_summaries and article.summary:
-                            # Clean and truncate summary
-                            summary = article.summary.replace('\n', ' ').strip()
-                            if len(summary) > 200:
-                                summary = summary[:197] + "..."
-                            context_parts.append(f"   Summary: {summary}")
-            
-            return "\n".join(context_parts)
+            # The article lists are cached objects, so identity usually
+            # tells us nothing changed without re-walking them
+            parts = (include_summaries, stories_per_category) + tuple(
+                item for category_articles in news_data.items() for item in category_articles
+            )
+            context = self._memoized(
+                'news',
+                parts,
+                lambda *_: self._render_news(news_data, include_summaries, stories_per_category)
+            )
+            # Headlines only
+            compact = self._memoized(
+                'news:compact',
+                parts[1:],
+                lambda *_: self._render_news(news_data, False, stories_per_category)
+            )
+            ages = [
+                self._stale_age(self._news_client.get_news, category, stories_per_category)
+                for category in categories
+            ]
+            staleness = self._staleness_note(max((age for age in ages if age is not None), default=None))
+            self._compact_sections['news'] = f"{compact}\n{staleness}" if staleness else compact
+            return f"{context}\n{staleness}" if staleness else context
             
         except Exception as e:
             print(f"Error getting news context: {e}")
+            self._compact_sections.pop('news', None)
             return "News data is currently unavailable."
 
+    @staticmethod
+    def _render_news(news_data: Dict[str, List[Any]], include_summaries: bool, stories_per_category: int) -> str:
+        context_parts = []
+        
+        for category, articles in news_data.items():
+            if articles:
+                context_parts.append(f"\n{category.title()} News (Top {stories_per_category}):")
+                for i, article in enumerate(articles, 1):
+                    # Format publish time
+                    time_str = article.published.strftime('%I:%M %p').lstrip('0')
+                    
+                    # Add numbered title and timestamp
+                    context_parts.append(f"{i}. [{time_str}] {article.title}")
+                    
+                    # Add summary if requested
+                    if include_summaries and article.summary:
+                        # Clean and truncate summary
+                        summary = article.summary.replace('\n', ' ').strip()
+                        if len(summary) > 200:
+                            summary = summary[:197] + "..."
+                        context_parts.append(f"   Summary: {summary}")
+        
+        return "\n".join(context_parts)
+
     async def _get_web_search_context(self, query: str) -> str:
         """Get relevant web search results for the query."""
         try:
@@ -195,6 +409,280 @@ class ContextManager:
             print(f"Error fetching web search results: {e}")
             return ""
 
+    async def _get_weather_context(self) -> str:
+        """Get current weather conditions context for the user's location."""
+        weather = await self.get_current_weather()
+        if not weather:
+            return ""
+
+        context = self._memoized('weather', (weather['data']['values'],), self._render_weather)
+        staleness = self._staleness_note(self._stale_age(
+            self._weather_client.get_realtime, (self._location.latitude, self._location.longitude)
+        ))
+        return f"{context}\n  {staleness}" if staleness else context
+
+    @staticmethod
+    def _render_weather(values: Dict[str, Any]) -> str:
+        return "\n".join([
+            f"  Temperature: {round(values['temperature'])}°F",
+            f"  Conditions: {values.get('weatherCode', 'Unknown')}",
+            f"  Wind Speed: {round(values['windSpeed'])} mph"
+        ])
+
+    def plan_context(self, message: str) -> ContextPlan:
+        """Decide locally which context sections a user message needs."""
+        return self._relevance_gate.plan(message)
+
+    def _section_tasks(
+        self,
+        query: str,
+        include_news_summaries: bool,
+        include_web_search: bool,
+        plan: Optional[ContextPlan] = None
+    ) -> Dict[str, Tuple[Optional[str], Any, Any]]:
+        """
+        Map each context section to its header, what it is fetched for (its
+        rendering may only stand in for one fetched for the same) and the
+        coroutine rendering it.
+        """
+        def wanted(name: str) -> bool:
+            return plan is None or plan.includes(name)
+
+        sections = {}
+        if self._location:
+            location = (self._location.latitude, self._location.longitude)
+            if wanted('weather'):
+                sections['weather'] = ("\nCurrent weather conditions:", location, self._get_weather_context())
+            if wanted('air_quality'):
+                sections['air_quality'] = ("\nCurrent air quality:", location, self._get_air_quality_context(location))
+            if wanted('pollen'):
+                sections['pollen'] = ("\nPollen information:", location, self._get_pollen_context(location))
+
+        if wanted('news'):
+            categories = plan.news_categories if plan and plan.news_categories else self.NEWS_CATEGORIES
+            sections['news'] = ("\nTop Stories:", (tuple(categories), include_news_summaries), self._get_news_context(
+                categories=categories,
+                include_summaries=include_news_summaries,
+                stories_per_category=self.STORIES_PER_CATEGORY
+            ))
+
+        if plan is not None:
+            include_web_search = include_web_search and plan.web_search
+        if include_web_search and query:
+            sections['web_search'] = (None, query, self._get_web_search_context(query))
+        return sections
+
+    async def _render_section(self, name: str, coro, deadline: float) -> str:
+        try:
+            return await asyncio.wait_for(coro, timeout=max(0.0, deadline))
+        except asyncio.TimeoutError:
+            print(f"Context section {name} missed its {deadline:.1f}s deadline")
+            raise
+
+    async def build_context(
+        self,
+        query: str = "",
+        include_news_summaries: bool = True,
+        include_web_search: bool = True,
+        turn_budget: Optional[float] = None,
+        token_budget: Optional[int] = None,
+        plan: Optional[ContextPlan] = None
+    ) -> ContextResult:
+        """
+        Assemble the LLM context, fetching every section concurrently.
+
+        Each section has its own deadline (SECTION_DEADLINES), capped by the
+        overall turn budget. A section that misses its deadline or fails is
+        replaced by its last successful rendering for the same location,
+        news categories or query (stale) or left out (missing); the upstream
+        fetch keeps running in the background via the shared cache so a
+        later turn can use it.
+
+        Args:
+            query: The user's query to get relevant web search results
+            include_news_summaries: Whether to include article summaries in news context
+            include_web_search: Whether to include web search results
+            turn_budget: Overall seconds allowed for assembling the context
+                (defaults to TURN_BUDGET)
+            token_budget: Maximum tokens in the context text (defaults to
+                the manager's token_budget); see _fit_to_budget
+            plan: Only fetch the sections, news categories and web search
+                this plan includes (see plan_context); everything by default
+        """
+        location = self._location
+        rendered, statuses = await self._build_sections(
+            query, include_news_summaries, include_web_search, turn_budget, plan
+        )
+        result = self._assemble(rendered, statuses, token_budget)
+        result.location = location
+        return result
+
+    async def _build_sections(
+        self,
+        query: str,
+        include_news_summaries: bool,
+        include_web_search: bool,
+        turn_budget: Optional[float],
+        plan: Optional[ContextPlan]
+    ) -> Tuple[List[Tuple[str, Optional[str], str]], Dict[str, SectionStatus]]:
+        """Fetch and render sections; see build_context."""
+        budget = self.TURN_BUDGET if turn_budget is None else turn_budget
+        sections = self._section_tasks(query, include_news_summaries, include_web_search, plan)
+
+        results = await asyncio.gather(*(
+            self._render_section(name, coro, min(self.SECTION_DEADLINES.get(name, budget), budget))
+            for name, (_, _, coro) in sections.items()
+        ), return_exceptions=True)
+
+        rendered: List[Tuple[str, Optional[str], str]] = []
+        statuses: Dict[str, SectionStatus] = {}
+        for (name, (header, variant, _)), result in zip(sections.items(), results):
+            last_variant, previous = self._last_sections.get(name, (None, None))
+            if isinstance(result, BaseException):
+                if not isinstance(result, asyncio.TimeoutError):
+                    print(f"Error building {name} context: {result}")
+                # Another query's search results or other categories' news
+                # would be wrong rather than stale
+                result = previous if last_variant == variant else None
+                statuses[name] = SectionStatus.STALE if result else SectionStatus.MISSING
+            else:
+                self._last_sections[name] = (variant, result)
+                statuses[name] = SectionStatus.FRESH
+
+            if result:
+                rendered.append((name, header, result))
+        return rendered, statuses
+
+    def _assemble(
+        self,
+        rendered: List[Tuple[str, Optional[str], str]],
+        statuses: Dict[str, SectionStatus],
+        token_budget: Optional[int] = None
+    ) -> ContextResult:
+        """Fit rendered sections to the token budget and join them."""
+        tokens = self.token_budget if token_budget is None else token_budget
+        trimmed: List[str] = []
+        fitted = rendered
+        if tokens is not None:
+            # Leave room for the time line added in front
+            fitted, trimmed = self._fit_to_budget(rendered, tokens - count_tokens(self._with_time("")))
+
+        context_parts = []
+        for _, header, text in fitted:
+            if header:
+                context_parts.append(header)
+            context_parts.append(text)
+
+        body = "\n".join(context_parts)
+        return ContextResult(
+            text=self._with_time(body),
+            sections=statuses,
+            body=body,
+            trimmed=trimmed,
+            parts=rendered
+        )
+
+    def _fit_to_budget(
+        self,
+        rendered: List[Tuple[str, Optional[str], str]],
+        budget: int
+    ) -> Tuple[List[Tuple[str, Optional[str], str]], List[str]]:
+        """
+        Fit rendered sections into a token budget.
+
+        Sections claim the budget in SECTION_PRIORITIES order, each taking its
+        full rendering if it fits, else its compact rendering, else as many
+        whole lines as fit (if at least MIN_SECTION_TOKENS remain), else
+        nothing. Display order is preserved.
+
+        Returns:
+            The sections to include, and the names of those shortened or dropped
+        """
+        remaining = budget
+        fitted: Dict[str, str] = {}
+        trimmed: List[str] = []
+        for name, header, text in sorted(
+            rendered, key=lambda section: self.SECTION_PRIORITIES.get(section[0], len(self.SECTION_PRIORITIES))
+        ):
+            overhead = count_tokens(header) + 1 if header else 0
+            compact = self._compact_sections.get(name) or text
+            for candidate in (text, compact):
+                cost = overhead + count_tokens(candidate) + 1
+                if cost <= remaining:
+                    break
+            else:
+                available = remaining - overhead - 1
+                candidate = truncate_to_tokens(compact, available) if available >= self.MIN_SECTION_TOKENS else ""
+                cost = overhead + count_tokens(candidate) + 1
+
+            if candidate is not text:
+                trimmed.append(name)
+            if candidate:
+                fitted[name] = candidate
+                remaining -= cost
+
+        return [(name, header, fitted[name]) for name, header, _ in rendered if name in fitted], trimmed
+
+    def _with_time(self, body: str) -> str:
+        """Prefix context body text with the current time."""
+        current_time = self.get_current_time()
+        time_line = f"Current time: {current_time.strftime('%I:%M %p').lstrip('0')}"
+        return f"{time_line}\n{body}" if body else time_line
+
+    def set_snapshot(self, result: ContextResult) -> None:
+        """Store a pre-rendered context for update_llm_context to serve."""
+        self._snapshot = result
+        self._snapshot_at = time.monotonic()
+
+    def _snapshot_expires_in(self) -> float:
+        """Seconds until the snapshot is too old to serve (negative if it is,
+        or if it was built for another location)."""
+        if self._snapshot is None or self._snapshot.location != self._location:
+            return -1.0
+        return self.SNAPSHOT_MAX_AGE - (time.monotonic() - self._snapshot_at)
+
+    def get_snapshot_text(self) -> Optional[str]:
+        """Get the pre-rendered context with the current time, if recent enough."""
+        if self._snapshot_expires_in() < 0:
+            return None
+        return self._with_time(self._snapshot.body)
+
+    async def _build_from_snapshot(self, query: str, plan: Optional[ContextPlan]) -> ContextResult:
+        """
+        Assemble the context a plan asks for, reusing the snapshot's sections.
+
+        Only what the snapshot can't provide is built: the web search, and
+        news when the plan narrows the categories (served from the cache the
+        refresher keeps warm).
+        """
+        snapshot = self._snapshot
+        if plan is None:
+            return snapshot
+
+        def reusable(name: str) -> bool:
+            if not plan.includes(name):
+                return False
+            return name != 'news' or list(plan.news_categories) == self.NEWS_CATEGORIES
+
+        reused = [part for part in snapshot.parts if reusable(part[0])]
+        statuses = {name: snapshot.sections[name] for name, _, _ in reused if name in snapshot.sections}
+        rendered = list(reused)
+        live = ContextPlan(
+            sections=frozenset(name for name in plan.sections if name not in statuses),
+            news_categories=plan.news_categories,
+            web_search=plan.web_search
+        )
+        if live.sections or (live.web_search and query):
+            built, built_statuses = await self._build_sections(query, True, True, None, live)
+            rendered += built
+            statuses.update(built_statuses)
+            # Keep the usual section order
+            order = list(self.SECTION_DEADLINES)
+            rendered.sort(key=lambda part: order.index(part[0]) if part[0] in order else len(order))
+        result = self._assemble(rendered, statuses)
+        result.location = snapshot.location
+        return result
+
     async def get_context_for_llm(self, query: str = "", include_news_summaries: bool = True, include_web_search: bool = True) -> str:
         """
         Generate a context string for the LLM that includes current time,
@@ -205,63 +693,64 @@ class ContextManager:
             include_news_summaries: Whether to include article summaries in news context
             include_web_search: Whether to include web search results
         """
-        context_parts = []
-        
-        # Add current time
-        current_time = datetime.now(ZoneInfo(self._location.timezone))
-        context_parts.append(f"Current time: {current_time.strftime('%I:%M %p').lstrip('0')}")
-        
-        # Add current weather conditions if available
-        if self._location:
-            weather = await self.get_current_weather()
-            if weather:
-                values = weather['data']['values']
-                context_parts.extend([
-                    "\nCurrent weather conditions:",
-                    f"  Temperature: {round(values['temperature'])}°F",
-                    f"  Conditions: {values.get('weatherCode', 'Unknown')}",
-                    f"  Wind Speed: {round(values['windSpeed'])} mph"
-                ])
-            
-            # Add current air quality
-            air_quality_context = await self._get_air_quality_context((self._location.latitude, self._location.longitude))
-            if air_quality_context:
-                context_parts.append("\nCurrent air quality:")
-                context_parts.append(air_quality_context)
-            
-            # Add pollen information
-            pollen_context = await self._get_pollen_context((self._location.latitude, self._location.longitude))
-            if pollen_context:
-                context_parts.append("\nPollen information:")
-                context_parts.append(pollen_context)
-        
-        # Add news information
-        news_context = await self._get_news_context(
-            categories=['austin', 'latest', 'us', 'world'],
-            include_summaries=include_news_summaries,
-            stories_per_category=3
-        )
-        if news_context:
-            context_parts.append("\nTop Stories:")
-            context_parts.append(news_context)
-        
-        # Add web search results if query is provided
-        if include_web_search and query:
-            web_context = await self._get_web_search_context(query)
-            if web_context:
-                context_parts.append(web_context)
-        
-        return "\n".join(context_parts)
+        result = await self.build_context(query, include_news_summaries, include_web_search)
+        return result.text
 
-    async def update_llm_context(self, llm_service) -> None:
+    def _compare_sent(self, consumer: Any, result: ContextResult) -> ContextResult:
+        """
+        Copy result with changed listing the sections that differ from what
+        consumer was sent on its previous turn, and remember this turn's.
+        """
+        previous = self._sent_sections.get(consumer, {})
+        current = {name: (text, name in result.trimmed) for name, _, text in result.parts}
+        changed = [
+            name for name, (text, trimmed) in current.items()
+            # Memoized renderings return the same string object when unchanged
+            if name not in previous or previous[name][1] != trimmed
+            or (previous[name][0] is not text and previous[name][0] != text)
+        ]
+        changed += [name for name in previous if name not in current]
+        self._sent_sections[consumer] = current
+        return replace(result, changed=changed)
+
+    async def update_llm_context(self, llm_service, message: str = "") -> ContextResult:
         """
         Update the LLM's context with current information.
         This should be called before each LLM interaction.
+
+        Args:
+            llm_service: The conversation to update
+            message: The user's message; when given, only the context it
+                needs is included (see plan_context)
+
+        Sections come from the snapshot while it is recent enough; only the
+        web search and anything else the snapshot lacks are fetched.
+
+        Returns:
+            The context sent, with changed listing the sections that differ
+            from what llm_service was sent on its previous turn
         """
-        context = await self.get_context_for_llm()
+        plan = self.plan_context(message) if message else None
+        expires_in = self._snapshot_expires_in()
+        if expires_in >= 0:
+            result = await self._build_from_snapshot(message, plan)
+        else:
+            result = await self.build_context(message, plan=plan)
+            expires_in = self.SNAPSHOT_MAX_AGE
+        context = self._with_time(result.body)
+        # The version identifies the context for the response cache. It
+        # leaves out the time line, so replies are shared across minutes,
+        # unless the reply may depend on the time (or the message is unknown)
+        version = fingerprint(result.body)
+        if plan is None or plan.time_sensitive:
+            version = fingerprint(context)
+            expires_in = min(expires_in, 60 - self.get_current_time().second)
         # Add the context as a system message
         llm_service.add_context_message(
             f"Here is the current context for this interaction:\n{context}\n\n"
             "Use this information when it's relevant to the user's questions or when "
-            "providing time-sensitive or location-aware responses."
+            "providing time-sensitive or location-aware responses.",
+            version=version,
+            expires_in=expires_in
         )
+        return self._compare_sent(llm_service, result)
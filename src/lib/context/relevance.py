@@ -0,0 +1,213 @@
+"""
+Query-aware gating of context sections.
+
+Decides from the user's message alone, without any network calls, which
+context sections a turn needs, which news categories to fetch and whether a
+web search is justified. Keyword patterns catch explicit mentions; a small
+TF-IDF model over hand-written section descriptions catches looser phrasing
+("should I go for a run?"). The current time and brief weather are always
+included.
+"""
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+import math
+import re
+
+# Sections included on every turn
+CORE_SECTIONS = frozenset({'weather'})
+
+# Explicit mentions that always select a section
+SECTION_PATTERNS: Dict[str, re.Pattern] = {
+    'weather': re.compile(
+        r"\b(weather|temperature|forecast|rain\w*|snow\w*|sunny|cloudy|wind\w*|humid\w*|storm\w*|"
+        r"umbrella|jacket|degrees|hot|cold|warm|chilly)\b", re.I),
+    'air_quality': re.compile(
+        r"\b(air|aqi|pollut\w*|smog|ozone|pm\s?2\.?5|pm\s?10|smoke|haze|breath\w*|asthma)\b", re.I),
+    'pollen': re.compile(
+        r"\b(pollen|allerg\w*|hay\s?fever|sneez\w*|cedar|ragweed|antihistamine)\b", re.I),
+    'news': re.compile(
+        r"\b(news|headlines?|top stories|happening|going on|current events|breaking|politic\w*|election)\b", re.I),
+}
+
+# Descriptions the TF-IDF model compares messages against
+SECTION_DESCRIPTIONS: Dict[str, str] = {
+    'weather': (
+        "weather temperature forecast rain rainy sunny cloudy hot cold warm wind outside outdoors "
+        "wear jacket umbrella degrees humid storm walk run bike drive commute"
+    ),
+    'air_quality': (
+        "air quality aqi pollution smog ozone smoke haze breathe breathing asthma lungs outside "
+        "outdoors run running jog exercise workout walk bike mask window"
+    ),
+    'pollen': (
+        "pollen allergy allergies allergic sneeze sneezing itchy eyes nose congestion hay fever "
+        "cedar oak tree grass weed ragweed season medicine antihistamine"
+    ),
+    'news': (
+        "news headlines stories happening events politics election president congress "
+        "government world country city local austin texas update breaking announced"
+    ),
+}
+
+NEWS_CATEGORY_PATTERNS: Dict[str, re.Pattern] = {
+    'austin': re.compile(r"\b(austin|local|texas|tx|atx|city|nearby|around here)\b", re.I),
+    'us': re.compile(
+        r"\b((?-i:US)|u\.s\.?|usa|america\w*|national|congress|senate|president|white house|federal|washington)\b",
+        re.I),
+    'world': re.compile(r"\b(world|global|international|foreign|abroad|europe\w*|asia\w*|africa\w*|war)\b", re.I),
+}
+
+# Requests to look something up
+SEARCH_PATTERN = re.compile(
+    r"\b(search|look\s?up|google|find out|latest on|what happened|who won|score|stock|price of|release date)\b",
+    re.I
+)
+# Questions about something recent that the ambient sections may not cover
+RECENCY_PATTERN = re.compile(
+    r"\b(latest|recent\w*|today|tonight|yesterday|this (week|month|year)|right now|currently|"
+    r"just (announced|released|happened))\b",
+    re.I
+)
+# Recency alone ("how do I cook rice today?") doesn't justify a paid search;
+# it also takes an event-like verb, a named entity or a factual question
+LOOKUP_PATTERN = re.compile(
+    r"\b(announc\w*|releas\w*|launch\w*|won|wins?|winners?|lost|beat|happen\w*|said|says|vote\w*|"
+    r"signed|passed|died|elected|resign\w*|report\w*|results?|scores?|stocks?|prices?)\b",
+    re.I
+)
+# A capitalized word mid-sentence, e.g. "did Apple" or "is the Fed"
+ENTITY_PATTERN = re.compile(r"(?<=[\w,;:] )[A-Z][A-Za-z0-9&]+")
+# Who/what/when-style questions, but not requests for advice ("what should I...")
+QUESTION_PATTERN = re.compile(
+    r"^\s*(who|what|when|where|which|did|does|has|have|was|were|is|are)\b(?!.*\b(?-i:I|me|my)\b)",
+    re.I
+)
+# Questions whose answer depends on the current time or date
+TIME_PATTERN = re.compile(
+    r"\b(time|clock|o'?clock|date|what day|which day|day is it|how (late|early|long until)|until|"
+    r"countdown|(hours?|minutes?) (left|until|from now|ago))\b",
+    re.I
+)
+# Messages that need no ambient context beyond the core
+TRIVIAL_PATTERN = re.compile(
+    r"^\s*(hi|hello|hey|thanks?( you)?|thx|ok(ay)?|bye|good (morning|night)|[\d\s+\-*/^().=x?]+|"
+    r"what('?s| is) [\d\s+\-*/^().x]+\??)\s*[.!?]*\s*$",
+    re.I
+)
+
+_WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def _tokenize(text: str) -> List[str]:
+    # Crude plural folding is enough for matching against short descriptions
+    return [
+        word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+        for word in _WORD.findall(text.lower())
+    ]
+
+
+class TfidfClassifier:
+    """Cosine similarity between a message and labelled descriptions,
+    weighted by TF-IDF over the descriptions"""
+
+    def __init__(self, descriptions: Dict[str, str]):
+        documents = {label: Counter(_tokenize(text)) for label, text in descriptions.items()}
+        document_frequency = Counter(term for counts in documents.values() for term in counts)
+        total = len(documents)
+        self._idf = {
+            term: math.log((1 + total) / (1 + frequency)) + 1
+            for term, frequency in document_frequency.items()
+        }
+        self._vectors = {label: self._vector(counts) for label, counts in documents.items()}
+
+    def _vector(self, counts: Counter) -> Dict[str, float]:
+        vector = {term: count * self._idf[term] for term, count in counts.items() if term in self._idf}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Similarity of text to each label, between 0 and 1"""
+        query = self._vector(Counter(_tokenize(text)))
+        return {
+            label: sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+            for label, vector in self._vectors.items()
+        }
+
+
+@dataclass
+class ContextPlan:
+    """Which context a turn should fetch and include"""
+    sections: frozenset = CORE_SECTIONS
+    news_categories: List[str] = field(default_factory=list)
+    web_search: bool = False
+    # The reply depends on the current time, not just the sections
+    time_sensitive: bool = False
+
+    def includes(self, section: str) -> bool:
+        return section in self.sections
+
+
+class RelevanceGate:
+    """Plans the context for a message using local rules only"""
+
+    def __init__(
+        self,
+        news_categories: Sequence[str],
+        threshold: float = 0.12,
+        classifier: Optional[TfidfClassifier] = None
+    ):
+        """
+        Initialize the gate.
+
+        Args:
+            news_categories: Categories available from the news source; a
+                general news request fetches all of them
+            threshold: Minimum TF-IDF similarity that selects a section
+            classifier: Model for loose matches (defaults to one built from
+                SECTION_DESCRIPTIONS)
+        """
+        self.news_categories = list(news_categories)
+        self.threshold = threshold
+        self.classifier = classifier or TfidfClassifier(SECTION_DESCRIPTIONS)
+
+    @staticmethod
+    def _asks_about_events(message: str) -> bool:
+        """Whether a message reads like a question about something that happened"""
+        return bool(
+            LOOKUP_PATTERN.search(message)
+            or ENTITY_PATTERN.search(message)
+            or QUESTION_PATTERN.match(message)
+        )
+
+    def plan(self, message: str) -> ContextPlan:
+        """Plan the context sections for a user message"""
+        time_sensitive = bool(TIME_PATTERN.search(message))
+        if not message or TRIVIAL_PATTERN.match(message):
+            return ContextPlan(time_sensitive=time_sensitive)
+
+        scores = self.classifier.scores(message)
+        matched = {
+            name for name, pattern in SECTION_PATTERNS.items()
+            if pattern.search(message) or scores.get(name, 0.0) >= self.threshold
+        }
+        sections = matched | CORE_SECTIONS
+
+        news_categories: List[str] = []
+        if 'news' in sections:
+            news_categories = [
+                category for category in self.news_categories
+                if category in NEWS_CATEGORY_PATTERNS and NEWS_CATEGORY_PATTERNS[category].search(message)
+            ] or list(self.news_categories)
+
+        # Search when asked to, or for recent events the ambient sections don't cover
+        web_search = bool(SEARCH_PATTERN.search(message)) or (
+            bool(RECENCY_PATTERN.search(message)) and not matched and self._asks_about_events(message)
+        )
+
+        return ContextPlan(
+            sections=frozenset(sections),
+            news_categories=news_categories,
+            web_search=web_search,
+            time_sensitive=time_sensitive
+        )
@@ -0,0 +1,207 @@
+"""
+Background refresh of ambient context sources.
+
+Keeps weather, air quality, pollen and news warm in the cache by refreshing
+them shortly before their TTLs run out, and keeps a pre-rendered context
+snapshot on the ContextManager so user turns don't wait on the network.
+"""
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import random
+from .manager import ContextManager
+
+
+@dataclass
+class RefreshJob:
+    """A context source refreshed on its own interval"""
+    name: str
+    interval: float
+    refresh: Callable[[], Awaitable[Any]]
+    # Seconds the source's cached value stays fresh, if it can tell
+    fresh_for: Optional[Callable[[], Awaitable[float]]] = None
+    failures: int = 0
+
+
+class EmptyRefresh(Exception):
+    """A source returned nothing; the allergy and news clients report
+    errors this way instead of raising"""
+
+
+class ContextRefresher:
+    """Scheduler that refreshes context sources off the request path.
+
+    Refreshes go through the same cached and rate-limited client methods as
+    user turns, so they share single-flight loads and never exceed upstream
+    quotas. A source is only reloaded once its cached value is about to
+    go stale, so one that a turn or another worker (through a shared cache)
+    loaded recently is left alone. Timers are jittered so workers don't
+    refresh in lockstep, and a failing source (one that raises or returns
+    nothing) backs off exponentially. The snapshot is first built once
+    every source has had its first run.
+    """
+
+    def __init__(
+        self,
+        context_manager: ContextManager,
+        interval: float = 270.0,
+        jitter: float = 0.1,
+        max_backoff: float = 1800.0,
+        lead: float = 30.0
+    ):
+        """
+        Initialize the refresher.
+
+        Args:
+            context_manager: Context manager whose sources and snapshot to keep warm
+            interval: Seconds between refreshes; slightly below the 300s
+                cache TTL so entries are replaced before they expire
+            jitter: Fractional random spread applied to every delay
+            max_backoff: Longest delay between retries of a failing source
+            lead: Reload a source once its cached value has fewer than this
+                many seconds of freshness left; until then runs are skipped
+        """
+        self.context_manager = context_manager
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.lead = lead
+        self.jobs = self._build_jobs(interval)
+        self._tasks: List[asyncio.Task] = []
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._snapshot_pending = False
+        # Jobs yet to finish their first run; the snapshot waits for them
+        self._first_round: Set[str] = set()
+
+    @staticmethod
+    def _cached_job(
+        name: str,
+        interval: float,
+        method: Any,
+        client: Any,
+        arguments: Callable[[], Tuple[tuple, Dict[str, Any]]]
+    ) -> RefreshJob:
+        """Job refreshing a @cached client method; arguments are read on
+        every run"""
+        def call(operation):
+            args, kwargs = arguments()
+            return operation(client, *args, **kwargs)
+        return RefreshJob(name, interval, lambda: call(method.refresh), lambda: call(method.fresh_for))
+
+    def _build_jobs(self, interval: float) -> List[RefreshJob]:
+        manager = self.context_manager
+        jobs = []
+
+        if manager.location:
+            weather = manager._weather_client
+            allergy = manager._allergy_client
+
+            def coordinates() -> Tuple[float, float]:
+                # Read on every run, so a manager that moved gets its new
+                # location refreshed
+                return manager.location.latitude, manager.location.longitude
+
+            # Arguments must match the ones ContextManager uses so the same
+            # cache entries are refreshed
+            jobs.extend([
+                self._cached_job('weather', interval, type(weather).get_realtime, weather,
+                                 lambda: ((coordinates(),), {})),
+                self._cached_job('air_quality', interval, type(allergy).get_air_quality, allergy,
+                                 lambda: (coordinates(), {})),
+                self._cached_job('pollen', interval, type(allergy).get_pollen_forecast, allergy,
+                                 lambda: (coordinates(), {'days': 1})),
+            ])
+
+        news = manager._news_client
+        for category in manager.NEWS_CATEGORIES:
+            jobs.append(self._cached_job(
+                f'news:{category}',
+                interval,
+                type(news).get_news,
+                news,
+                lambda category=category: ((category, manager.STORIES_PER_CATEGORY), {})
+            ))
+        return jobs
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _run_job(self, job: RefreshJob):
+        # Spread the first refreshes so workers don't all start at once
+        await asyncio.sleep(random.uniform(0, self.jitter * job.interval))
+        while True:
+            delay = await self._run_once(job)
+            if job.name in self._first_round:
+                self._first_round.discard(job.name)
+                if not self._first_round:
+                    self._schedule_snapshot()
+            await asyncio.sleep(self._jittered(delay))
+
+    async def _run_once(self, job: RefreshJob) -> float:
+        """Refresh a source unless its cached value is still fresh enough,
+        returning the delay before its next run"""
+        try:
+            fresh_for = await job.fresh_for() if job.fresh_for is not None else 0.0
+            if fresh_for > self.lead:
+                # Loaded since the last run by a turn or another worker
+                job.failures = 0
+                self._schedule_snapshot()
+                return fresh_for - self.lead
+            if not await job.refresh():
+                raise EmptyRefresh("no data returned")
+            job.failures = 0
+            self._schedule_snapshot()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            print(f"Error refreshing {job.name} context: {e}")
+
+        if job.failures:
+            return min(self.max_backoff, job.interval / 8 * 2 ** job.failures)
+        return job.interval
+
+    def _schedule_snapshot(self):
+        """Rebuild the snapshot once, coalescing refreshes that finish together"""
+        if self._first_round:
+            # Building now would load the sources still waiting for their
+            # first run, which would then load them again
+            return
+        if self._snapshot_task is not None and not self._snapshot_task.done():
+            self._snapshot_pending = True
+            return
+        self._snapshot_task = asyncio.ensure_future(self._rebuild_snapshot())
+
+    async def _rebuild_snapshot(self):
+        while True:
+            self._snapshot_pending = False
+            try:
+                # Sources were just refreshed, so this is served from cache.
+                # Web search is query-specific and never part of the snapshot.
+                result = await self.context_manager.build_context(include_web_search=False)
+                self.context_manager.set_snapshot(result)
+            except Exception as e:
+                print(f"Error rebuilding context snapshot: {e}")
+            if not self._snapshot_pending:
+                return
+
+    def start(self):
+        """Start refreshing in the background on the running event loop."""
+        if not self._tasks:
+            self._first_round = {job.name for job in self.jobs}
+            self._tasks = [asyncio.ensure_future(self._run_job(job)) for job in self.jobs]
+
+    async def stop(self):
+        """Stop all refresh tasks."""
+        tasks = self._tasks + ([self._snapshot_task] if self._snapshot_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._snapshot_task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
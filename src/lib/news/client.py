@@ -5,9 +5,14 @@ from datetime import datetime
 import asyncio
 import httpx
 from ..utils.cache import cached
+from ..utils.circuit_breaker import circuit_breaker
+from ..utils.http_cache import conditional_get
+from ..utils.sqlite_cache import cache_type
+from ..utils.resilience import RetryPolicy
 from zoneinfo import ZoneInfo
 import time
 
+@cache_type
 @dataclass
 class NewsArticle:
     title: str
@@ -33,10 +38,19 @@ class NewsClient:
         'austin': 'https://www.fox7austin.com/rss/category/local-news'
     }
     
+    TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+    RETRY_POLICY = RetryPolicy(name='news_feeds', attempts=3, attempt_timeout=5.0, hedge=True)
+    
     def __init__(self):
         """Initialize the news client."""
         pass
     
+    async def _parse_response(self, response: httpx.Response) -> feedparser.FeedParserDict:
+        """Parse an RSS response (feedparser is synchronous, so run in thread pool)."""
+        return await asyncio.get_event_loop().run_in_executor(
+            None, feedparser.parse, response.text
+        )
+    
     async def _parse_feed(self, feed_data: feedparser.FeedParserDict, limit: int = None) -> List[NewsArticle]:
         """Parse feed data and return a list of NewsArticle objects."""
         articles = []
@@ -59,7 +73,8 @@ class NewsClient:
         
         return articles
     
-    @cached(ttl_seconds=300)  # Cache for 5 minutes
+    @cached(ttl_seconds=300, stale_while_revalidate=600, max_stale=1800)  # Fresh for 5 minutes, served stale while refreshing
+    @circuit_breaker('fox_news', is_failure=lambda articles: not articles, empty=list)
     async def get_news(self, category: str = 'latest', limit: int = 5) -> List[NewsArticle]:
         """
         Fetch news articles from the specified category.
@@ -75,16 +90,12 @@ class NewsClient:
             raise ValueError(f"Invalid category. Choose from: {', '.join(self.FEED_URLS.keys())}")
         
         try:
-            # Fetch RSS feed
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.FEED_URLS[category])
-                response.raise_for_status()
-                feed_content = response.text
-            
-            # Parse feed (feedparser is synchronous, so run in thread pool)
-            feed = await asyncio.get_event_loop().run_in_executor(
-                None, feedparser.parse, feed_content
-            )
+            # Fetch RSS feed, reusing the parsed feed when it hasn't changed
+            feed = await self.RETRY_POLICY.run(lambda: conditional_get(
+                self.FEED_URLS[category],
+                self._parse_response,
+                timeout=self.TIMEOUT
+            ))
             
             return await self._parse_feed(feed, limit)
             
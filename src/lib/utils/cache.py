@@ -1,59 +1,540 @@
-from typing import Any, Optional, Callable
-from datetime import datetime, timedelta
+from typing import Any, Optional, Callable, List, Tuple, Dict, Iterable
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, fields, is_dataclass
+from datetime import date, datetime
+import asyncio
+import functools
+import hashlib
+import heapq
+import inspect
+import os
+import sys
+import time
 import json
+from .metrics import registry
+
+# Defaults applied by the @cached decorator so long-running workers plateau
+# instead of keeping every distinct query forever.
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+
+@dataclass
+class CacheEntry:
+    """A cached value with its monotonic expiry times and approximate size"""
+    value: Any
+    expires: float
+    stale_until: float
+    size: int
+
+    def is_fresh(self, now: float) -> bool:
+        """Whether the value is still within its TTL"""
+        return now < self.expires
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate the in-memory size of a value in bytes.
+
+    Walks containers and dataclass/object attributes so that nested JSON
+    payloads are accounted for, not just the outer dict.
+    """
+    seen = set()
+    stack = [value]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+            stack.append(vars(obj))
+    return total
+
+
+class CacheBackend:
+    """Interface for cache storage backends.
+
+    Expiry times in CacheEntry are expressed in the backend's own clock, so
+    callers comparing against them must use backend.clock().
+    """
+
+    clock = staticmethod(time.monotonic)
 
-class Cache:
-    """Simple in-memory cache with TTL"""
-    
-    def __init__(self):
-        self._cache = {}
-    
     def get(self, key: str) -> Optional[Any]:
         """Get a value from cache if it exists and hasn't expired"""
-        if key not in self._cache:
+        entry = self.get_entry(key)
+        if entry is None or not entry.is_fresh(self.clock()):
             return None
-            
-        entry = self._cache[key]
-        if entry['expires'] < datetime.now():
-            del self._cache[key]
+        return entry.value
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """Get the entry for a key, including entries past their TTL but
+        still inside their stale window"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl_seconds: int, stale_seconds: int = 0):
+        """Set a value in cache with TTL and an optional stale window"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """Remove a value from the cache if present"""
+        raise NotImplementedError
+
+    def usage(self, prefix: str) -> Tuple[int, int]:
+        """Number of entries whose keys start with prefix and their
+        approximate size in bytes"""
+        raise NotImplementedError
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """get for use on the event loop"""
+        entry = await self.aget_entry(key)
+        if entry is None or not entry.is_fresh(self.clock()):
             return None
-            
-        return entry['value']
-    
-    def set(self, key: str, value: Any, ttl_seconds: int):
-        """Set a value in cache with TTL"""
-        self._cache[key] = {
-            'value': value,
-            'expires': datetime.now() + timedelta(seconds=ttl_seconds)
-        }
-    
+        return entry.value
+
+    async def aget_entry(self, key: str) -> Optional[CacheEntry]:
+        """get_entry for use on the event loop; backends that block
+        override it to run off the loop"""
+        return self.get_entry(key)
+
+    async def aset(self, key: str, value: Any, ttl_seconds: int, stale_seconds: int = 0):
+        """set for use on the event loop; backends that block override it
+        to run off the loop"""
+        self.set(key, value, ttl_seconds, stale_seconds)
+
+    def clear(self):
+        """Clear all cached values"""
+        raise NotImplementedError
+
+
+class Cache(CacheBackend):
+    """In-memory LRU cache with TTL and optional entry/byte budgets"""
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        on_evict: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of entries to keep (None for unbounded)
+            max_bytes: Approximate maximum total size of cached values in bytes
+                (None for unbounded)
+            on_evict: Called with the key of each entry evicted to stay
+                within budget (not for expired entries)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._cache: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # (stale_until, key) pairs; entries leave the cache at stale_until
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @property
+    def size_bytes(self) -> int:
+        """Approximate total size of cached values in bytes"""
+        return self._bytes
+
+    def usage(self, prefix: str) -> Tuple[int, int]:
+        entries = [entry for key, entry in list(self._cache.items()) if key.startswith(prefix)]
+        return len(entries), sum(entry.size for entry in entries)
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """Get the entry for a key, including entries past their TTL but
+        still inside their stale window"""
+        now = self.clock()
+        self._sweep(now)
+
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+
+        self._cache.move_to_end(key)
+        return entry
+
+    def set(self, key: str, value: Any, ttl_seconds: int, stale_seconds: int = 0):
+        """
+        Set a value in cache with TTL.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl_seconds: How long the value is fresh
+            stale_seconds: How long past its TTL the entry is kept for
+                stale serving before it is dropped
+        """
+        now = self.clock()
+        self._sweep(now)
+
+        if key in self._cache:
+            self._remove(key)
+
+        expires = now + ttl_seconds
+        entry = CacheEntry(
+            value=value,
+            expires=expires,
+            stale_until=expires + stale_seconds,
+            size=estimate_size(value)
+        )
+        self._cache[key] = entry
+        self._bytes += entry.size
+        heapq.heappush(self._expiry_heap, (entry.stale_until, key))
+
+        self._evict()
+        self._compact_heap()
+
+    def delete(self, key: str):
+        """Remove a value from the cache if present"""
+        if key in self._cache:
+            self._remove(key)
+
     def clear(self):
         """Clear all cached values"""
         self._cache.clear()
+        self._expiry_heap.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str):
+        entry = self._cache.pop(key)
+        self._bytes -= entry.size
+
+    def _sweep(self, now: float):
+        """Drop expired entries from the front of the expiry heap.
+
+        Each heap item is pushed once per set() and popped at most once, so
+        the sweep is amortized O(1) per operation. Heap items whose entry was
+        overwritten or evicted are recognised by a mismatched expiry and skipped.
+        """
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            stale_until, key = heapq.heappop(heap)
+            entry = self._cache.get(key)
+            if entry is not None and entry.stale_until == stale_until:
+                self._remove(key)
+
+    def _evict(self):
+        """Evict least-recently-used entries until within budget"""
+        while self._cache and (
+            (self.max_entries is not None and len(self._cache) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._cache))
+            self._remove(key)
+            if self.on_evict is not None:
+                self.on_evict(key)
+
+    def _compact_heap(self):
+        """Rebuild the expiry heap when it is dominated by orphaned items"""
+        if len(self._expiry_heap) > 2 * len(self._cache) + 64:
+            self._expiry_heap = [(entry.stale_until, key) for key, entry in self._cache.items()]
+            heapq.heapify(self._expiry_heap)
+
+
+def canonicalize(value: Any) -> Any:
+    """Convert a value into a JSON-serializable form that is stable across
+    instances and processes.
+
+    Dicts are key-sorted, dataclasses (e.g. PerplexityConfig, Location) are
+    expanded field by field, and objects may opt in with a __cache_key__()
+    method. Objects with no stable representation fall back to their
+    attributes rather than a repr containing a memory address.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, '__cache_key__'):
+        return canonicalize(value.__cache_key__())
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {'__dict__': sorted([str(k), canonicalize(v)] for k, v in value.items())}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((canonicalize(v) for v in value), key=repr)
+    if is_dataclass(value) and not isinstance(value, type):
+        return {
+            '__type__': type(value).__qualname__,
+            'fields': [[f.name, canonicalize(getattr(value, f.name))] for f in fields(value)]
+        }
+    if hasattr(value, '__dict__') and not isinstance(value, type):
+        return {'__type__': type(value).__qualname__, 'attrs': canonicalize(vars(value))}
+    return repr(value)
 
 
-def cached(ttl_seconds: int):
-    """Decorator to cache function results"""
+def fingerprint(value: Any) -> str:
+    """Hash a value's canonical form to a short, stable digest"""
+    payload = json.dumps(canonicalize(value), separators=(',', ':'), sort_keys=True, default=repr)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def make_key_builder(func: Callable, unordered_args: Iterable[str] = ()) -> Callable[..., str]:
+    """
+    Build a function that derives cache keys for calls to func.
+
+    Arguments are bound to func's signature with defaults applied, so
+    get_news('latest') and get_news(category='latest', limit=5) share a key.
+    A bound instance (self/cls) is skipped unless it defines __cache_key__(),
+    which makes keys identical across client instances. The canonical
+    arguments are hashed to a fixed-size digest.
+
+    Args:
+        func: The function being cached
+        unordered_args: Names of list arguments whose order doesn't matter
+            (e.g. requested fields); these are sorted before hashing
+    """
+    signature = inspect.signature(func)
+    parameters = list(signature.parameters)
+    skip_first = bool(parameters) and parameters[0] in ('self', 'cls')
+    unordered = set(unordered_args)
+    prefix = f"{func.__module__}.{func.__qualname__}"
+
+    def build_key(*args, **kwargs) -> str:
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+
+        key_parts = []
+        for index, (name, value) in enumerate(bound.arguments.items()):
+            if index == 0 and skip_first:
+                if not hasattr(value, '__cache_key__'):
+                    continue
+                value = value.__cache_key__()
+            value = canonicalize(value)
+            if name in unordered and isinstance(value, list):
+                value = sorted(value, key=repr)
+            key_parts.append([name, value])
+
+        payload = json.dumps(key_parts, separators=(',', ':'), sort_keys=True, default=repr)
+        digest = hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+        return f"{prefix}:{digest}"
+
+    return build_key
+
+
+CACHE_HITS = registry.counter('cache_hits_total', 'Calls answered with a fresh cached value')
+CACHE_MISSES = registry.counter('cache_misses_total', 'Calls that had to wait for the wrapped function')
+CACHE_STALE = registry.counter('cache_stale_served_total', 'Calls answered with a stale value during revalidation')
+CACHE_EVICTIONS = registry.counter('cache_evictions_total', 'Entries evicted to stay within the cache budget')
+CACHE_ENTRIES = registry.gauge('cache_entries', 'Number of cached entries')
+CACHE_BYTES = registry.gauge('cache_bytes', 'Approximate size of cached values in bytes')
+CACHE_LOAD_SECONDS = registry.histogram('cache_load_seconds', 'Latency of the wrapped function on cache loads')
+
+class _TTLHint:
+    """TTL suggested by the function currently being loaded"""
+    __slots__ = ('ttl', 'store')
+
+    def __init__(self):
+        self.ttl: Optional[float] = None
+        self.store = True
+
+
+_ttl_hint: ContextVar[Optional[_TTLHint]] = ContextVar('cache_ttl_hint', default=None)
+
+
+def suggest_ttl(seconds: float):
+    """
+    Override the TTL of the result currently being computed for @cached.
+
+    Called from inside a cached function (e.g. with the freshness lifetime from
+    upstream Cache-Control/Expires headers); the decorator's ttl_seconds is
+    then only a fallback. If several suggestions are made the shortest wins.
+    Outside a cached call this does nothing.
+    """
+    hint = _ttl_hint.get()
+    if hint is not None:
+        hint.ttl = seconds if hint.ttl is None else min(hint.ttl, seconds)
+
+
+def skip_cache():
+    """
+    Keep the result currently being computed for @cached out of the cache.
+
+    For values that are returned to the caller but mustn't be reused, e.g. a
+    circuit breaker's last-known-good fallback or a response marked
+    no-store. Outside a cached call this does nothing.
+    """
+    hint = _ttl_hint.get()
+    if hint is not None:
+        hint.store = False
+
+
+_default_backend: Optional[CacheBackend] = None
+
+
+def default_backend() -> Optional[CacheBackend]:
+    """Get the host-wide shared backend configured by CACHE_DB_PATH, if any.
+
+    When CACHE_DB_PATH is set every @cached function stores its results in
+    that SQLite file, so worker processes share hits and survive restarts.
+    """
+    global _default_backend
+    path = os.getenv('CACHE_DB_PATH')
+    if not path:
+        return None
+    if _default_backend is None or _default_backend.path != path:
+        from .sqlite_cache import SQLiteCache
+        _default_backend = SQLiteCache(path)
+    return _default_backend
+
+
+def cached(
+    ttl_seconds: int,
+    max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+    max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+    single_flight: bool = True,
+    stale_while_revalidate: int = 0,
+    max_stale: Optional[int] = None,
+    backend: Optional[CacheBackend] = None,
+    unordered_args: Iterable[str] = ()
+):
+    """
+    Decorator to cache function results.
+
+    Args:
+        ttl_seconds: How long a result stays fresh, unless the function
+            reports a different lifetime through suggest_ttl()
+        max_entries: Maximum number of results kept per decorated function
+        max_bytes: Approximate memory budget per decorated function
+        single_flight: Coalesce concurrent misses on the same key into one
+            upstream call whose result (or error) is shared by all waiters
+        stale_while_revalidate: Seconds past the TTL during which an expired
+            result is returned immediately while a background task refreshes it
+        max_stale: Hard limit in seconds past the TTL. Between
+            stale_while_revalidate and max_stale callers block on the refresh
+            and only get the stale result if the refresh fails; after max_stale
+            the entry is dropped. Defaults to stale_while_revalidate.
+        backend: Storage to use instead of a private in-memory Cache, e.g. a
+            SQLiteCache shared by every worker on the host. Defaults to
+            default_backend().
+        unordered_args: Names of list arguments whose order doesn't affect
+            the result, so differently ordered calls share a cache entry
+    """
+    if max_stale is None:
+        max_stale = stale_while_revalidate
+    if max_stale < stale_while_revalidate:
+        raise ValueError("max_stale must be at least stale_while_revalidate")
+
     def decorator(func: Callable):
-        cache = Cache()
-        
-        async def wrapper(*args, **kwargs):
-            # Create a cache key from function name and arguments
-            key_parts = [func.__name__]
-            key_parts.extend(str(arg) for arg in args)
-            key_parts.extend(f"{k}={v}" for k, v in sorted(kwargs.items()))
-            cache_key = ":".join(key_parts)
-            
-            # Try to get from cache
-            cached_value = cache.get(cache_key)
-            if cached_value is not None:
-                return cached_value
-            
+        name = f"{func.__module__}.{func.__qualname__}"
+        local_cache = Cache(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            on_evict=lambda key: CACHE_EVICTIONS.inc(function=name)
+        )
+        build_key = make_key_builder(func, unordered_args)
+        in_flight: Dict[str, asyncio.Task] = {}
+
+        def get_cache() -> CacheBackend:
+            # Resolved per call so CACHE_DB_PATH may be loaded after import
+            return backend or default_backend() or local_cache
+
+        def usage():
+            cache = get_cache()
+            if cache is local_cache:
+                return len(local_cache), local_cache.size_bytes
+            # A shared backend holds other functions' entries too
+            return cache.usage(f"{name}:")
+
+        CACHE_ENTRIES.set_function(lambda: usage()[0], function=name)
+        CACHE_BYTES.set_function(lambda: usage()[1], function=name)
+
+        async def load(cache_key: str, args, kwargs):
             # Call function and cache result
-            result = await func(*args, **kwargs)
-            if result is not None:
-                cache.set(cache_key, result, ttl_seconds)
+            hint = _TTLHint()
+            token = _ttl_hint.set(hint)
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            finally:
+                CACHE_LOAD_SECONDS.observe(time.perf_counter() - start, function=name)
+                _ttl_hint.reset(token)
+            if result is not None and hint.store:
+                ttl = hint.ttl if hint.ttl is not None else ttl_seconds
+                await get_cache().aset(cache_key, result, ttl, stale_seconds=max_stale)
             return result
-            
+
+        def finish(cache_key: str, task: asyncio.Task):
+            if in_flight.get(cache_key) is task:
+                del in_flight[cache_key]
+            # Mark the error as retrieved in case every waiter was cancelled
+            # or nobody waited (background refresh)
+            if not task.cancelled():
+                task.exception()
+
+        def start_load(cache_key: str, args, kwargs) -> asyncio.Task:
+            # Join an in-flight call for this key or start one. The call runs
+            # as its own task so a cancelled waiter doesn't cancel the others.
+            task = in_flight.get(cache_key)
+            if task is None:
+                task = asyncio.ensure_future(load(cache_key, args, kwargs))
+                in_flight[cache_key] = task
+                task.add_done_callback(lambda t: finish(cache_key, t))
+            return task
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = build_key(*args, **kwargs)
+
+            # Try to get from cache
+            cache = get_cache()
+            now = cache.clock()
+            entry = await cache.aget_entry(cache_key)
+            if entry is not None:
+                if entry.is_fresh(now):
+                    CACHE_HITS.inc(function=name)
+                    return entry.value
+                if now < entry.expires + stale_while_revalidate:
+                    # Serve stale and refresh off the caller's path
+                    CACHE_STALE.inc(function=name)
+                    start_load(cache_key, args, kwargs)
+                    return entry.value
+
+            CACHE_MISSES.inc(function=name)
+
+            if entry is None and not single_flight:
+                return await load(cache_key, args, kwargs)
+
+            task = start_load(cache_key, args, kwargs)
+            if entry is None:
+                return await asyncio.shield(task)
+
+            # Past the revalidate window but within max_stale: wait for the
+            # refresh, falling back to the stale value if it fails
+            try:
+                result = await asyncio.shield(task)
+            except Exception:
+                return entry.value
+            return result if result is not None else entry.value
+
+        async def refresh(*args, **kwargs):
+            """Reload the value for these arguments regardless of freshness"""
+            cache_key = build_key(*args, **kwargs)
+            return await asyncio.shield(start_load(cache_key, args, kwargs))
+
+        async def fresh_for(*args, **kwargs) -> float:
+            """Seconds the cached value for these arguments stays fresh (0 if
+            it is missing or stale)"""
+            cache = get_cache()
+            entry = await cache.aget_entry(build_key(*args, **kwargs))
+            return 0.0 if entry is None else max(0.0, entry.expires - cache.clock())
+
+        wrapper.cache = local_cache
+        wrapper.get_cache = get_cache
+        wrapper.build_key = build_key
+        wrapper.refresh = refresh
+        wrapper.fresh_for = fresh_for
         return wrapper
     return decorator
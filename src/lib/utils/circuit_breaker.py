@@ -0,0 +1,234 @@
+"""
+Circuit breaker for upstream data sources.
+
+When a source keeps failing the breaker opens and calls are answered locally
+(last-known-good value, or nothing) instead of waiting on a network timeout.
+After a recovery timeout a single trial call is let through (half-open); if it
+succeeds the breaker closes again.
+"""
+from enum import Enum
+from typing import Any, Callable, Dict, Optional, Tuple
+import functools
+import time
+from .cache import Cache, make_key_builder, skip_cache
+from .resilience import is_retryable
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a circuit is open and no last-known-good value exists"""
+
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker with negative caching"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30,
+        negative_ttl: float = 15,
+        last_good_ttl: float = 24 * 60 * 60
+    ):
+        """
+        Initialize the circuit breaker.
+
+        Args:
+            name: Name of the upstream source
+            failure_threshold: Consecutive failures before the circuit opens
+            recovery_timeout: Seconds to stay open before a half-open trial
+            negative_ttl: Seconds a failed key is answered locally without
+                retrying the upstream, even while the circuit is closed
+            last_good_ttl: Seconds a last-known-good value may be served
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.negative_ttl = negative_ttl
+        self.last_good_ttl = last_good_ttl
+
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_success_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._negative = Cache(max_entries=1024)
+        self._last_good = Cache(max_entries=256)
+
+    def stale_age(self, key: str) -> Optional[float]:
+        """Age in seconds of the last good data for a key while the source
+        is failing, or None when it is healthy"""
+        if self.state == CircuitState.CLOSED and self.failures == 0 and self._negative.get(key) is None:
+            return None
+        last_good = self.last_good(key)
+        return None if last_good is None else last_good[1]
+
+    def last_good(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Get the last-known-good value for a key and its age in seconds"""
+        entry = self._last_good.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        return value, time.monotonic() - stored_at
+
+    def _allow_request(self, key: str) -> bool:
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            self.state = CircuitState.HALF_OPEN
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+        return self._negative.get(key) is None
+
+    def record_success(self, key: str, value: Any):
+        now = time.monotonic()
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.last_success_at = now
+        self._negative.delete(key)
+        self._last_good.set(key, (value, now), self.last_good_ttl)
+
+    def record_failure(self, key: str):
+        self.failures += 1
+        self._negative.set(key, True, self.negative_ttl)
+        if self.state == CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != CircuitState.OPEN:
+                print(f"Circuit for {self.name} opened after {self.failures} failures")
+            self.state = CircuitState.OPEN
+            self.opened_at = time.monotonic()
+
+    async def call(
+        self,
+        key: str,
+        func: Callable,
+        args: tuple,
+        kwargs: dict,
+        is_failure: Optional[Callable[[Any], bool]] = None,
+        empty: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        """
+        Call func through the breaker.
+
+        Only upstream failures count against the source: timeouts,
+        transport errors and 5xx responses (see resilience.is_retryable), or
+        results matching is_failure. Other errors, such as a ValueError for
+        bad arguments, propagate without touching the breaker.
+
+        Args:
+            key: Cache key identifying the request
+            func: Coroutine function to call
+            args: Positional arguments for func
+            kwargs: Keyword arguments for func
+            is_failure: Predicate for results that signal a failure, for
+                clients that swallow errors and return None/empty results
+            empty: Builds the result for is_failure clients when the source
+                is failing and there is no last-known-good value (default None)
+
+        Returns:
+            The fresh result, or the last-known-good value when the source is
+            failing. Clients using is_failure get empty() when there is no
+            last-known-good value.
+
+        Raises:
+            CircuitOpenError: If the call is short-circuited and there is no
+                last-known-good value (exception-raising clients only)
+        """
+        if not self._allow_request(key):
+            return self._fallback(key, is_failure, empty)
+
+        trial = self.state == CircuitState.HALF_OPEN
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            self.record_failure(key)
+            if self.last_good(key) is None:
+                raise
+            return self._fallback(key, is_failure, empty)
+        finally:
+            if trial:
+                self._trial_in_flight = False
+
+        if is_failure is not None and is_failure(result):
+            self.record_failure(key)
+            return self._fallback(key, is_failure, empty)
+
+        self.record_success(key, result)
+        return result
+
+    def _fallback(
+        self,
+        key: str,
+        is_failure: Optional[Callable[[Any], bool]],
+        empty: Optional[Callable[[], Any]]
+    ) -> Any:
+        # Old data must not be cached as a fresh result
+        skip_cache()
+        last_good = self.last_good(key)
+        if last_good is not None:
+            return last_good[0]
+        if is_failure is not None:
+            return empty() if empty is not None else None
+        raise CircuitOpenError(f"Circuit for {self.name} is open")
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str, **kwargs) -> CircuitBreaker:
+    """Get or create the circuit breaker for an upstream source"""
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name, **kwargs)
+    return _breakers[name]
+
+
+def circuit_breaker(
+    name: str,
+    is_failure: Optional[Callable[[Any], bool]] = None,
+    empty: Optional[Callable[[], Any]] = None,
+    **breaker_kwargs
+):
+    """
+    Decorator to guard an upstream call with a named circuit breaker.
+
+    Functions sharing a name share a breaker, so one failing source trips
+    every call to it. Place it below @cached, directly around the upstream
+    call, so it only sees real loads rather than cache hits; its fallback
+    values are kept out of the cache.
+
+    Args:
+        name: Name of the upstream source
+        is_failure: Predicate for results that signal a failure
+        empty: Builds the result returned while failing when there is no
+            last-known-good value (is_failure functions only; default None)
+        **breaker_kwargs: Options passed to CircuitBreaker on creation
+    """
+    def decorator(func: Callable):
+        breaker = get_breaker(name, **breaker_kwargs)
+        build_key = make_key_builder(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = build_key(*args, **kwargs)
+            return await breaker.call(key, func, args, kwargs, is_failure, empty)
+
+        def stale_age(*args, **kwargs) -> Optional[float]:
+            """Age of the last good data for these arguments while the
+            source is failing, or None when it is healthy"""
+            return breaker.stale_age(build_key(*args, **kwargs))
+
+        wrapper.breaker = breaker
+        wrapper.stale_age = stale_age
+        return wrapper
+    return decorator
@@ -0,0 +1,89 @@
+"""
+Shared, pooled HTTP clients for upstream APIs.
+
+Opening a new httpx.AsyncClient per request pays a TCP and TLS handshake on
+every call. Instead each upstream host gets one long-lived client with
+keep-alive (and HTTP/2 when the h2 package is installed), reused by every
+caller in the process.
+"""
+from typing import Dict, Tuple
+import asyncio
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=20,
+    max_keepalive_connections=10,
+    keepalive_expiry=60.0
+)
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+
+class HTTPClientPool:
+    """One long-lived AsyncClient per upstream host"""
+
+    def __init__(
+        self,
+        limits: httpx.Limits = DEFAULT_LIMITS,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        http2: bool = HTTP2_AVAILABLE
+    ):
+        """
+        Initialize the pool.
+
+        Args:
+            limits: Connection pool limits applied to each host's client
+            timeout: Default timeout; callers should still pass an explicit
+                per-request timeout suited to the upstream
+            http2: Negotiate HTTP/2 where the server supports it
+        """
+        self.limits = limits
+        self.timeout = timeout
+        self.http2 = http2
+        self._clients: Dict[str, Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        """Get the shared client for the host serving url"""
+        host = httpx.URL(url).host
+        loop = asyncio.get_running_loop()
+
+        existing = self._clients.get(host)
+        if existing is not None:
+            client_loop, client = existing
+            # Connections are bound to the loop that opened them
+            if client_loop is loop and not client.is_closed:
+                return client
+
+        client = httpx.AsyncClient(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2
+        )
+        self._clients[host] = (loop, client)
+        return client
+
+    async def aclose(self):
+        """Close every client owned by the running event loop"""
+        loop = asyncio.get_running_loop()
+        for host, (client_loop, client) in list(self._clients.items()):
+            if client_loop is loop:
+                await client.aclose()
+            del self._clients[host]
+
+
+_pool = HTTPClientPool()
+
+
+def get_client(url: str) -> httpx.AsyncClient:
+    """Get the process-wide shared client for the host serving url"""
+    return _pool.get(url)
+
+
+async def aclose_clients():
+    """Close all shared clients; they are recreated on next use"""
+    await _pool.aclose()
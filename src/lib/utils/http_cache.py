@@ -0,0 +1,180 @@
+"""
+HTTP caching semantics for upstream fetches.
+
+Remembers ETag/Last-Modified validators together with the parsed result of
+each GET, revalidates with If-None-Match/If-Modified-Since and reuses the
+parsed result on 304 Not Modified. Freshness lifetimes from Cache-Control and
+Expires are passed to @cached through suggest_ttl(), so the hard-coded TTLs
+become a fallback.
+"""
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Union
+import hashlib
+import inspect
+import json
+import time
+import httpx
+from .cache import Cache, skip_cache, suggest_ttl
+from .http import get_client
+
+# Validators are kept much longer than results are fresh: a 304 is only
+# useful if we still hold the body it refers to.
+VALIDATOR_TTL = 24 * 60 * 60
+# Shortest TTL taken from response headers. Our callers serve stale results
+# while refreshing, so a zero lifetime would mean an upstream request (and
+# quota) on every call.
+MIN_TTL = 60
+
+
+@dataclass
+class ConditionalEntry:
+    """Validators and parsed result of a previous response"""
+    etag: Optional[str]
+    last_modified: Optional[str]
+    parsed: Any
+
+
+_validators = Cache(max_entries=512, max_bytes=32 * 1024 * 1024)
+
+
+def _parse_http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _cache_control(headers: Mapping[str, str]) -> Dict[str, Optional[str]]:
+    directives: Dict[str, Optional[str]] = {}
+    for part in headers.get('cache-control', '').split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def is_no_store(headers: Mapping[str, str]) -> bool:
+    """Whether a response must not be stored at all"""
+    return 'no-store' in _cache_control(headers)
+
+
+def freshness_lifetime(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Compute how many more seconds a response stays fresh.
+
+    Returns:
+        Seconds of remaining freshness (0 for no-store), or None if the
+        response carries no freshness information. no-cache only requires
+        revalidation before reuse, which conditional_get does cheaply with
+        the stored validators, so it leaves the caller's own TTL in charge.
+    """
+    directives = _cache_control(headers)
+    if 'no-store' in directives:
+        return 0.0
+    if 'no-cache' in directives:
+        return None
+
+    for name in ('s-maxage', 'max-age'):
+        if directives.get(name) is not None:
+            try:
+                max_age = float(directives[name])
+            except ValueError:
+                continue
+            try:
+                age = float(headers.get('age', 0))
+            except ValueError:
+                age = 0.0
+            return max(0.0, max_age - age)
+
+    if 'expires' in headers:
+        expires = _parse_http_date(headers['expires'])
+        if expires is None:
+            return 0.0  # Invalid Expires means already expired
+        date = _parse_http_date(headers['date']) if 'date' in headers else None
+        return max(0.0, expires - (date or time.time()))
+
+    return None
+
+
+def note_freshness(response: httpx.Response, min_ttl: float = MIN_TTL):
+    """Use a response's freshness lifetime, but at least min_ttl, as the TTL
+    of the cached result; a no-store result isn't cached at all"""
+    if is_no_store(response.headers):
+        skip_cache()
+        return
+    lifetime = freshness_lifetime(response.headers)
+    if lifetime is not None:
+        suggest_ttl(max(lifetime, min_ttl))
+
+
+def _request_key(url: str, params: Optional[Mapping[str, Any]]) -> str:
+    payload = json.dumps([url, sorted((params or {}).items())], default=str, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+async def conditional_get(
+    url: str,
+    parse: Callable[[httpx.Response], Union[Any, Awaitable[Any]]],
+    *,
+    params: Optional[Mapping[str, Any]] = None,
+    headers: Optional[Mapping[str, str]] = None,
+    timeout: Optional[httpx.Timeout] = None,
+    on_response: Optional[Callable[[httpx.Response], None]] = None,
+    min_ttl: float = MIN_TTL
+) -> Any:
+    """
+    GET a URL through the shared client with conditional revalidation.
+
+    Args:
+        url: URL to fetch
+        parse: Turns a 200 response into the result (may be async); its
+            output is what gets reused on 304
+        params: Query parameters
+        headers: Extra request headers
+        timeout: Per-request timeout
+        on_response: Called with every response before status checks, e.g.
+            to report it to an adaptive rate limiter
+        min_ttl: Shortest TTL to take from the response headers, to bound
+            how often the source is refetched
+
+    Returns:
+        The parsed result, fresh or reused from a previous response
+
+    Raises:
+        httpx.HTTPStatusError: If the upstream returns an error status
+    """
+    key = _request_key(url, params)
+    entry: Optional[ConditionalEntry] = _validators.get(key)
+
+    request_headers = dict(headers or {})
+    if entry is not None:
+        if entry.etag:
+            request_headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            request_headers['If-Modified-Since'] = entry.last_modified
+
+    client = get_client(url)
+    kwargs = {'timeout': timeout} if timeout is not None else {}
+    response = await client.get(url, params=params, headers=request_headers, **kwargs)
+    if on_response is not None:
+        on_response(response)
+
+    note_freshness(response, min_ttl)
+    if response.status_code == 304 and entry is not None:
+        return entry.parsed
+
+    response.raise_for_status()
+    parsed = parse(response)
+    if inspect.isawaitable(parsed):
+        parsed = await parsed
+
+    if is_no_store(response.headers):
+        _validators.delete(key)
+        return parsed
+
+    etag = response.headers.get('etag')
+    last_modified = response.headers.get('last-modified')
+    if etag or last_modified:
+        _validators.set(key, ConditionalEntry(etag, last_modified, parsed), VALIDATOR_TTL)
+    return parsed
@@ -1,60 +1,338 @@
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+from contextvars import ContextVar
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Mapping, Optional, Tuple, Union
 import asyncio
+import functools
+import hashlib
+import os
+import time
+
+@dataclass
+class RateLimitSignal:
+    """Throttling information reported by an upstream response"""
+    throttled: bool
+    retry_after: Optional[float] = None
+    remaining: Optional[float] = None
+    reset_after: Optional[float] = None
+
+
+def _parse_seconds(value: str) -> Optional[float]:
+    """Parse a delay given as seconds, an epoch timestamp or an HTTP date"""
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    # Some providers send the reset time as an epoch timestamp
+    if seconds > 1_000_000_000:
+        return max(0.0, seconds - time.time())
+    return max(0.0, seconds)
+
+
+def parse_rate_limit_headers(status_code: int, headers: Mapping[str, str]) -> RateLimitSignal:
+    """
+    Extract throttling information from a response.
+
+    Understands 429 status codes, Retry-After, and X-RateLimit-*/RateLimit-*
+    headers, including per-window variants such as Tomorrow.io's
+    X-RateLimit-Remaining-hour. With several windows the lowest remaining
+    count wins, and the reset is that of the window which ran out (the
+    earliest, if several did) rather than the longest window's.
+    """
+    lowered = {k.lower(): v for k, v in headers.items()}
+
+    retry_after = None
+    if 'retry-after' in lowered:
+        retry_after = _parse_seconds(lowered['retry-after'])
+
+    # Keyed by window suffix, e.g. '-second', '-day' or '' for a single window
+    remaining_by_window: Dict[str, float] = {}
+    reset_by_window: Dict[str, float] = {}
+    for name, value in lowered.items():
+        if not name.startswith(('x-ratelimit-', 'ratelimit-')):
+            continue
+        field = name.split('ratelimit-', 1)[1]
+        if field.startswith('remaining'):
+            try:
+                remaining_by_window[field[len('remaining'):]] = float(value)
+            except ValueError:
+                continue
+        elif field.startswith('reset'):
+            seconds = _parse_seconds(value)
+            if seconds is not None:
+                window = field[len('reset'):]
+                reset_by_window[window[len('-after'):] if window.startswith('-after') else window] = seconds
+
+    remaining = min(remaining_by_window.values(), default=None)
+    reset_after = None
+    if reset_by_window:
+        # The windows holding the request back: those exhausted, else the
+        # most restrictive ones; windows without a remaining count only
+        # decide when no window reports one
+        limiting = [w for w, left in remaining_by_window.items() if left <= 0 and w in reset_by_window]
+        if not limiting and remaining is not None:
+            limiting = [w for w, left in remaining_by_window.items() if left == remaining and w in reset_by_window]
+        if not limiting:
+            limiting = list(reset_by_window)
+        reset_after = min(reset_by_window[w] for w in limiting)
+
+    return RateLimitSignal(
+        throttled=status_code == 429,
+        retry_after=retry_after,
+        remaining=remaining,
+        reset_after=reset_after
+    )
+
 
 class RateLimiter:
-    """Rate limiter with token bucket algorithm"""
-    
-    def __init__(self, max_requests: int, time_window: int):
+    """Rate limiter with token bucket algorithm.
+
+    Waiters reserve tokens up front: when the bucket is empty the balance goes
+    negative and each caller sleeps exactly until its own reservation is
+    covered. Reservations are made in call order, so waiters are served FIFO
+    without holding a lock or polling.
+
+    In adaptive mode observe_response() reacts to upstream throttling: a 429
+    halves the refill rate and pauses the bucket until Retry-After (or the
+    rate-limit reset), and each unthrottled response ramps the rate back up
+    towards the configured limit. Waiters already queued when a pause begins
+    check for it when they wake and wait out its length before proceeding.
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(
+        self,
+        max_requests: int,
+        time_window: int,
+        adaptive: bool = False,
+        min_scale: float = 0.1,
+        ramp_step: float = 0.05
+    ):
         """
         Initialize rate limiter.
-        
+
         Args:
             max_requests: Maximum number of requests allowed in time window
             time_window: Time window in seconds
+            adaptive: Adjust the rate from upstream throttling responses
+            min_scale: Lowest fraction of the configured rate to back off to
+            ramp_step: Fraction of the configured rate regained per
+                unthrottled response
         """
         self.max_requests = max_requests
         self.time_window = time_window
-        self.tokens = max_requests
-        self.last_update = datetime.now()
-        self._lock = asyncio.Lock()
-    
-    async def acquire(self):
-        """Acquire a token, waiting if necessary"""
-        async with self._lock:
-            while self.tokens <= 0:
-                now = datetime.now()
-                time_passed = (now - self.last_update).total_seconds()
-                self.tokens = min(
-                    self.max_requests,
-                    self.tokens + (time_passed * self.max_requests / self.time_window)
-                )
-                self.last_update = now
-                if self.tokens <= 0:
-                    await asyncio.sleep(0.1)  # Wait a bit before checking again
-            
-            self.tokens -= 1
-            return True
-
-
-def rate_limited(max_requests: int, time_window: int):
-    """Decorator to rate limit a function"""
-    limiters: Dict[str, RateLimiter] = {}
-    
+        self.adaptive = adaptive
+        self.min_scale = min_scale
+        self.ramp_step = ramp_step
+        self.tokens = float(max_requests)
+        # May lie in the future while the bucket is paused
+        self.last_update = self.clock()
+        self.scale = 1.0
+        # End of the latest pause, in clock time, and the total seconds
+        # pauses have pushed the refill back by
+        self.paused_until = 0.0
+        self.paused_total = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Tokens added per second"""
+        return self.max_requests * self.scale / self.time_window
+
+    def _refill(self, now: float):
+        if now > self.last_update:
+            self.tokens = min(
+                self.max_requests,
+                self.tokens + (now - self.last_update) * self.rate
+            )
+            self.last_update = now
+
+    def _check(self, n: int):
+        if n < 1 or n > self.max_requests:
+            raise ValueError(f"Can't acquire {n} tokens from a bucket of {self.max_requests}")
+
+    def _reserve(self, n: int, allow_debt: bool) -> float:
+        """Take n tokens, returning the seconds to wait for them, or -1 if
+        allow_debt is False and they aren't available now"""
+        return self._take(n, allow_debt)
+
+    def _take(self, n: int, allow_debt: bool) -> float:
+        now = self.clock()
+        self._refill(now)
+        # A negative balance means others are queued; don't jump ahead of them
+        if self.tokens < n and not allow_debt:
+            return -1.0
+        self.tokens -= n
+        return max(0.0, self.last_update - now) + max(0.0, -self.tokens) / self.rate
+
+    def _release(self, n: int):
+        self.tokens += n
+
+    def _pause(self, now: float, seconds: float):
+        self.tokens = min(self.tokens, 0.0)
+        self.last_update = max(self.last_update, now + seconds)
+        end = now + seconds
+        self.paused_total += max(0.0, end - max(self.paused_until, now))
+        self.paused_until = max(self.paused_until, end)
+
+    def _settle(self, since: float) -> Tuple[float, float]:
+        """
+        Check a reservation once its wait is over.
+
+        Args:
+            since: paused_total when the reservation was made
+
+        Returns:
+            The seconds pauses since then have pushed the reservation back
+            (0 if none), and the current paused_total
+        """
+        return self.paused_total - since, self.paused_total
+
+    def _observe(self, signal: RateLimitSignal):
+        now = self.clock()
+        # Settle tokens earned at the old rate before changing it
+        self._refill(now)
+        if signal.throttled:
+            self.scale = max(self.min_scale, self.scale / 2)
+            pause = signal.retry_after or signal.reset_after or 1 / self.rate
+            self._pause(now, pause)
+            print(f"Upstream throttled; rate scaled to {self.scale:.2f} and paused {pause:.1f}s")
+            return
+
+        if signal.remaining is not None:
+            self.tokens = min(self.tokens, signal.remaining)
+            if signal.remaining <= 0:
+                self._pause(now, signal.retry_after or signal.reset_after or 1 / self.rate)
+                return
+        self.scale = min(1.0, self.scale + self.ramp_step)
+
+    def observe_response(self, status_code: int, headers: Mapping[str, str]):
+        """Adapt the rate to an upstream response (adaptive mode only)"""
+        if self.adaptive:
+            self._observe(parse_rate_limit_headers(status_code, headers))
+
+    def try_acquire(self, n: int = 1) -> bool:
+        """Acquire n tokens if they are available right now, without waiting"""
+        self._check(n)
+        return self._reserve(n, allow_debt=False) >= 0
+
+    async def try_acquire_async(self, n: int = 1) -> bool:
+        """Like try_acquire(), for callers on the event loop"""
+        return self.try_acquire(n)
+
+    async def _reserve_async(self, n: int) -> Tuple[float, float]:
+        return self._reserve(n, allow_debt=True), self.paused_total
+
+    async def _settle_async(self, since: float) -> Tuple[float, float]:
+        return self._settle(since)
+
+    async def acquire(self, n: int = 1):
+        """Acquire n tokens, waiting if necessary"""
+        self._check(n)
+        delay, paused_total = await self._reserve_async(n)
+        while delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # Hand the reservation back so it isn't counted against the quota
+                self._release(n)
+                raise
+            # A pause that began while we slept pushes our turn back by its length
+            delay, paused_total = await self._settle_async(paused_total)
+        return True
+
+
+_limiters: Dict[str, RateLimiter] = {}
+
+# Limiter of the rate_limited call in progress, so retries and hedges made
+# inside it can take their own tokens
+_active_limiter: ContextVar[Optional[RateLimiter]] = ContextVar('active_limiter', default=None)
+
+
+def active_limiter() -> Optional[RateLimiter]:
+    """
+    Get the limiter of the enclosing rate_limited call, if any.
+
+    The decorator pays for one request; code that sends more requests
+    inside the call (retries, hedges) must acquire a token for each.
+    """
+    return _active_limiter.get()
+
+
+def quota_group(name: str, api_key: str) -> str:
+    """Build a quota group name scoped to an API key without exposing it"""
+    return f"{name}:{hashlib.sha256(api_key.encode()).hexdigest()[:12]}"
+
+
+def get_limiter(group: str, max_requests: int, time_window: int, adaptive: bool = False) -> RateLimiter:
+    """
+    Get or create the limiter for a quota group.
+
+    When RATE_LIMIT_DB_PATH is set the bucket lives in that SQLite file and is
+    shared by every worker process on the host; otherwise it is in-process.
+    """
+    if group not in _limiters:
+        path = os.getenv('RATE_LIMIT_DB_PATH')
+        if path:
+            from .shared_rate_limit import SharedRateLimiter
+            _limiters[group] = SharedRateLimiter(path, group, max_requests, time_window, adaptive=adaptive)
+        else:
+            _limiters[group] = RateLimiter(max_requests, time_window, adaptive=adaptive)
+    return _limiters[group]
+
+
+def observe_response(group: str, response) -> None:
+    """Report an upstream httpx response to a quota group's limiter"""
+    limiter = _limiters.get(group)
+    if limiter is not None:
+        limiter.observe_response(response.status_code, response.headers)
+
+
+def rate_limited(
+    max_requests: int,
+    time_window: int,
+    group: Optional[Union[str, Callable[..., str]]] = None,
+    adaptive: bool = False
+):
+    """
+    Decorator to rate limit a function.
+
+    Args:
+        max_requests: Maximum number of requests allowed in time window
+        time_window: Time window in seconds
+        group: Quota group drawing from one bucket, either a name or a
+            callable receiving the call's arguments (e.g. to key on the
+            client's API key). Defaults to one bucket per function.
+        adaptive: Let responses reported through observe_response() lower
+            and restore the rate
+    """
     def decorator(func):
         # Create a unique key for this function
         key = f"{func.__module__}.{func.__qualname__}"
-        
+
+        @functools.wraps(func)
         async def wrapper(*args, **kwargs):
-            # Get or create limiter for this function
-            if key not in limiters:
-                limiters[key] = RateLimiter(max_requests, time_window)
-            
+            # Get or create limiter for this function's quota group
+            if group is None:
+                name = key
+            elif callable(group):
+                name = group(*args, **kwargs)
+            else:
+                name = group
+            limiter = get_limiter(name, max_requests, time_window, adaptive=adaptive)
+
             # Wait for token
-            await limiters[key].acquire()
-            
-            # Call function
-            return await func(*args, **kwargs)
-        
+            await limiter.acquire()
+
+            # Call function, letting it pay for any extra requests it sends
+            token = _active_limiter.set(limiter)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _active_limiter.reset(token)
+
         return wrapper
     return decorator
@@ -0,0 +1,146 @@
+"""
+Retry, timeout and hedging policy for upstream calls.
+"""
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+import asyncio
+import random
+import time
+import httpx
+from .metrics import registry
+from .rate_limit import active_limiter
+
+T = TypeVar('T')
+
+UPSTREAM_RETRIES = registry.counter('upstream_retries_total', 'Upstream attempts retried after a transient failure')
+UPSTREAM_HEDGES = registry.counter('upstream_hedges_total', 'Duplicate upstream requests fired after the hedge delay')
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an error is transient: timeouts, connection errors and 5xx"""
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return False
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How to call an upstream: per-attempt timeout, retries with exponential
+    backoff and full jitter, and optional hedging.
+
+    With hedging, if an attempt hasn't answered after the observed p95
+    latency a duplicate request is fired and whichever finishes first wins.
+    Only enable it for idempotent calls on upstreams where an occasional
+    extra request doesn't cost quota or money.
+
+    Inside a rate_limited call the decorator's token pays for the first
+    attempt only: each retry waits for a token of its own, and a hedge is
+    skipped unless a token is free right away.
+    """
+    name: str
+    attempts: int = 3
+    attempt_timeout: Optional[float] = None
+    base_delay: float = 0.2
+    max_delay: float = 2.0
+    idempotent: bool = True
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    latencies: LatencyTracker = field(default_factory=LatencyTracker, repr=False)
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number attempt (0-based), with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None if hedging is off"""
+        if not self.hedge or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self.latencies.quantile(self.hedge_quantile)
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run call under this policy.
+
+        Args:
+            call: Zero-argument coroutine factory; invoked once per attempt
+                (and per hedge)
+
+        Returns:
+            The first successful result
+
+        Raises:
+            The last error once attempts are exhausted, or immediately for
+            non-transient errors and non-idempotent calls
+        """
+        attempts = self.attempts if self.idempotent else 1
+        limiter = active_limiter()
+        for attempt in range(attempts):
+            if attempt and limiter is not None:
+                await limiter.acquire()
+            try:
+                if self.attempt_timeout is not None:
+                    return await asyncio.wait_for(self._attempt(call), self.attempt_timeout)
+                return await self._attempt(call)
+            except Exception as e:
+                if attempt == attempts - 1 or not is_retryable(e):
+                    raise
+                UPSTREAM_RETRIES.inc(policy=self.name)
+                await asyncio.sleep(self.backoff(attempt))
+
+    async def _timed(self, call: Callable[[], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        result = await call()
+        self.latencies.record(time.perf_counter() - start)
+        return result
+
+    async def _attempt(self, call: Callable[[], Awaitable[T]]) -> T:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._timed(call)
+
+        tasks = [asyncio.ensure_future(self._timed(call))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            limiter = active_limiter()
+            if not done and (limiter is None or await limiter.try_acquire_async()):
+                UPSTREAM_HEDGES.inc(policy=self.name)
+                tasks.append(asyncio.ensure_future(self._timed(call)))
+
+            # First success wins; an error only counts once every request failed
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
@@ -0,0 +1,140 @@
+"""
+Token bucket stored in SQLite so every worker process on a host draws from
+one upstream quota.
+"""
+from typing import Callable, Optional, Tuple, TypeVar
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from .rate_limit import RateLimiter, RateLimitSignal
+
+T = TypeVar('T')
+
+
+def _report_error(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error updating shared rate limit bucket: {future.exception()}")
+
+
+class SharedRateLimiter(RateLimiter):
+    """Rate limiter with a token bucket shared across processes.
+
+    Each operation loads the bucket row inside an IMMEDIATE transaction, runs
+    the same reservation/adaptation logic as RateLimiter and writes the row
+    back. Reservations are serialized by SQLite's write lock, so waiters across
+    all workers are served in order and together never exceed the quota, and a
+    throttling response seen by one worker slows down all of them.
+    """
+
+    clock = staticmethod(time.time)
+
+    def __init__(self, path: str, name: str, max_requests: int, time_window: int, **kwargs):
+        """
+        Initialize rate limiter.
+
+        Args:
+            path: Path to the SQLite database file (created if missing)
+            name: Bucket name; limiters with the same name share tokens
+            max_requests: Maximum number of requests allowed in time window
+            time_window: Time window in seconds
+            **kwargs: Adaptive options passed to RateLimiter
+        """
+        super().__init__(max_requests, time_window, **kwargs)
+        self.path = path
+        self.name = name
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not be shared across fork(), so reopen per process
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, last_update REAL NOT NULL, "
+                "scale REAL NOT NULL DEFAULT 1.0, paused_until REAL NOT NULL DEFAULT 0, "
+                "paused_total REAL NOT NULL DEFAULT 0)"
+            )
+            for column in (
+                "scale REAL NOT NULL DEFAULT 1.0",
+                "paused_until REAL NOT NULL DEFAULT 0",
+                "paused_total REAL NOT NULL DEFAULT 0"
+            ):
+                try:
+                    conn.execute(f"ALTER TABLE buckets ADD COLUMN {column}")
+                except sqlite3.OperationalError:
+                    pass  # Column already exists
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _transaction(self, operation: Callable[[], T]) -> T:
+        """Run operation against the shared bucket state atomically"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, last_update, scale, paused_until, paused_total FROM buckets WHERE name = ?",
+                    (self.name,)
+                ).fetchone()
+                if row is None:
+                    self.tokens, self.last_update = float(self.max_requests), self.clock()
+                    self.scale, self.paused_until, self.paused_total = 1.0, 0.0, 0.0
+                else:
+                    self.tokens, self.last_update, self.scale, self.paused_until, self.paused_total = row
+
+                result = operation()
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets "
+                    "(name, tokens, last_update, scale, paused_until, paused_total) VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.name, self.tokens, self.last_update, self.scale, self.paused_until, self.paused_total)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _reserve(self, n: int, allow_debt: bool) -> float:
+        return self._transaction(lambda: self._take(n, allow_debt))
+
+    def _in_background(self, operation: Callable[[], None]):
+        """Run a transaction off the event loop if one is running; callers
+        don't need its result and must not wait on other workers' locks"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._transaction(operation)
+            return
+        future = loop.run_in_executor(None, self._transaction, operation)
+        future.add_done_callback(_report_error)
+
+    def _release(self, n: int):
+        self._in_background(lambda: super(SharedRateLimiter, self)._release(n))
+
+    def _observe(self, signal: RateLimitSignal):
+        self._in_background(lambda: super(SharedRateLimiter, self)._observe(signal))
+
+    async def try_acquire_async(self, n: int = 1) -> bool:
+        self._check(n)
+        reserved = await asyncio.to_thread(self._reserve, n, False)
+        return reserved >= 0
+
+    async def _reserve_async(self, n: int) -> Tuple[float, float]:
+        # Run the transaction off the event loop; it may wait on other workers
+        return await asyncio.to_thread(
+            self._transaction, lambda: (self._take(n, True), self.paused_total)
+        )
+
+    async def _settle_async(self, since: float) -> Tuple[float, float]:
+        # Pauses may come from any worker, so read the shared state
+        return await asyncio.to_thread(self._transaction, lambda: self._settle(since))
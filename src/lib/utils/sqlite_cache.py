@@ -0,0 +1,222 @@
+"""
+SQLite-backed cache shared by every worker process on a host.
+"""
+from dataclasses import fields, is_dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple, TypeVar
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import json
+import zlib
+from .cache import CacheBackend, CacheEntry
+
+T = TypeVar('T')
+
+# Payloads at least this large are zlib-compressed before storing
+COMPRESS_THRESHOLD = 512
+
+_JSON = b'j'
+_JSON_ZLIB = b'z'
+
+# Dataclasses that may be stored, by tag. Only these are rebuilt when
+# decoding, so a blob in the shared file can't name arbitrary classes.
+_TYPES: Dict[str, type] = {}
+_TYPE_TAG = '__cache_type__'
+_DATETIME_TAG = '__datetime__'
+
+
+def cache_type(cls: T) -> T:
+    """Class decorator allowing a dataclass to be stored in SQLiteCache"""
+    if not is_dataclass(cls):
+        raise TypeError(f"{cls.__qualname__} is not a dataclass")
+    _TYPES[f"{cls.__module__}.{cls.__qualname__}"] = cls
+    return cls
+
+
+def _encode_object(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {_DATETIME_TAG: value.isoformat()}
+    tag = f"{type(value).__module__}.{type(value).__qualname__}"
+    if _TYPES.get(tag) is type(value):
+        return {_TYPE_TAG: tag, 'fields': {f.name: getattr(value, f.name) for f in fields(value)}}
+    raise TypeError(f"Can't store {type(value).__qualname__} in the cache; register it with @cache_type")
+
+
+def _decode_object(obj: Dict[str, Any]) -> Any:
+    if _TYPE_TAG in obj:
+        cls = _TYPES.get(obj[_TYPE_TAG])
+        if cls is None:
+            raise ValueError(f"Unknown cached type: {obj[_TYPE_TAG]}")
+        return cls(**obj['fields'])
+    if _DATETIME_TAG in obj:
+        return datetime.fromisoformat(obj[_DATETIME_TAG])
+    return obj
+
+
+def encode_value(value: Any) -> bytes:
+    """Serialize a value to a compact binary blob.
+
+    Values are stored as compact UTF-8 JSON, zlib-compressed when large.
+    Datetimes and dataclasses registered with @cache_type (e.g. lists of
+    NewsArticle) are written as tagged objects.
+
+    Raises:
+        TypeError: If the value holds anything else that isn't JSON
+    """
+    raw = json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=_encode_object).encode('utf-8')
+    if len(raw) >= COMPRESS_THRESHOLD:
+        return _JSON_ZLIB + zlib.compress(raw)
+    return _JSON + raw
+
+
+def decode_value(blob: bytes) -> Any:
+    """Deserialize a blob produced by encode_value"""
+    kind, payload = blob[:1], blob[1:]
+    if kind == _JSON:
+        return json.loads(payload, object_hook=_decode_object)
+    if kind == _JSON_ZLIB:
+        return json.loads(zlib.decompress(payload), object_hook=_decode_object)
+    raise ValueError(f"Unknown cache payload type: {kind!r}")
+
+
+class SQLiteCache(CacheBackend):
+    """Cache stored in a SQLite database in WAL mode.
+
+    All processes opening the same file share entries, so identical upstream
+    data is fetched once per host rather than once per worker, and a restarted
+    worker starts warm. Expiry uses wall-clock time since monotonic clocks are
+    not comparable across processes.
+    """
+
+    clock = staticmethod(time.time)
+
+    def __init__(self, path: str, max_entries: Optional[int] = 10000, sweep_interval: int = 100):
+        """
+        Initialize the cache.
+
+        Args:
+            path: Path to the SQLite database file (created if missing)
+            max_entries: Maximum number of rows to keep; the entries closest to
+                expiry are dropped first when over the limit
+            sweep_interval: Number of writes between expiry/size sweeps
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not be shared across fork(), so reopen per process
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires REAL NOT NULL, stale_until REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_stale_until ON cache (stale_until)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    @property
+    def size_bytes(self) -> int:
+        """Total size of stored payloads in bytes"""
+        with self._lock:
+            return self._connect().execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()[0]
+
+    def usage(self, prefix: str) -> Tuple[int, int]:
+        """Number of live rows whose keys start with prefix and their size in bytes"""
+        # A key range rather than LIKE so the primary key index is used
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        with self._lock:
+            return self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache "
+                "WHERE key >= ? AND key < ? AND stale_until > ?",
+                (prefix, upper, self.clock())
+            ).fetchone()
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """Get the entry for a key, including entries past their TTL but
+        still inside their stale window"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value, expires, stale_until FROM cache WHERE key = ? AND stale_until > ?",
+                (key, self.clock())
+            ).fetchone()
+        if row is None:
+            return None
+
+        blob, expires, stale_until = row
+        try:
+            value = decode_value(blob)
+        except (ValueError, TypeError) as e:
+            # Written by an older version or tampered with; treat as a miss
+            print(f"Ignoring undecodable cache entry {key}: {e}")
+            return None
+        return CacheEntry(
+            value=value,
+            expires=expires,
+            stale_until=stale_until,
+            size=len(blob)
+        )
+
+    def set(self, key: str, value: Any, ttl_seconds: int, stale_seconds: int = 0):
+        """Set a value in cache with TTL and an optional stale window"""
+        try:
+            blob = encode_value(value)
+        except (TypeError, ValueError) as e:
+            print(f"Not caching {key}: {e}")
+            return
+        expires = self.clock() + ttl_seconds
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, stale_until) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(blob), expires, expires + stale_seconds)
+            )
+            self._writes += 1
+            if self._writes % self.sweep_interval == 0:
+                self._sweep(conn)
+
+    async def aget_entry(self, key: str) -> Optional[CacheEntry]:
+        # Queries may wait up to the busy timeout on another worker's write
+        return await asyncio.to_thread(self.get_entry, key)
+
+    async def aset(self, key: str, value: Any, ttl_seconds: int, stale_seconds: int = 0):
+        await asyncio.to_thread(self.set, key, value, ttl_seconds, stale_seconds)
+
+    def delete(self, key: str):
+        """Remove a value from the cache if present"""
+        with self._lock:
+            self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        """Clear all cached values"""
+        with self._lock:
+            self._connect().execute("DELETE FROM cache")
+
+    def _sweep(self, conn: sqlite3.Connection):
+        """Drop expired rows and trim the table to max_entries"""
+        conn.execute("DELETE FROM cache WHERE stale_until <= ?", (self.clock(),))
+        if self.max_entries is not None:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY stale_until DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
@@ -0,0 +1,60 @@
+"""
+Token counting for sizing prompts.
+
+Uses tiktoken (installed alongside langchain-openai) when available and falls
+back to a character-based estimate otherwise. Counts are memoized because the
+same section texts are measured turn after turn.
+"""
+from typing import Optional
+import functools
+import math
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+DEFAULT_ENCODING = "cl100k_base"
+# Rough characters per token for English text
+CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(name: str) -> Optional["tiktoken.Encoding"]:
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # The encoding files are downloaded on first use and may be unreachable
+        print(f"Falling back to estimated token counts: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def count_tokens(text: str, encoding: str = DEFAULT_ENCODING) -> int:
+    """Count the tokens in text, or estimate them without tiktoken"""
+    if not text:
+        return 0
+    enc = _encoding(encoding)
+    if enc is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding: str = DEFAULT_ENCODING) -> str:
+    """Keep as many whole lines of text as fit in max_tokens"""
+    if count_tokens(text, encoding) <= max_tokens:
+        return text
+
+    kept = []
+    used = 0
+    for line in text.split("\n"):
+        # Each line break costs about a token
+        cost = count_tokens(line, encoding) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept).rstrip()
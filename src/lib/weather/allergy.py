@@ -3,10 +3,20 @@ from typing import Dict, Any, Optional
 import httpx
 from datetime import datetime, timedelta
 from ..utils.cache import cached
+from ..utils.circuit_breaker import circuit_breaker
+from ..utils.rate_limit import rate_limited, quota_group, observe_response
+from ..utils.http import get_client
+from ..utils.http_cache import conditional_get, note_freshness
+from ..utils.resilience import RetryPolicy
 
 class AllergyClient:
     """Client for accessing Google Maps Pollen API"""
     
+    TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+    # Both lookups are read-only and the quota is large, so hedge slow requests
+    AIR_QUALITY_POLICY = RetryPolicy(name='google_air_quality', attempts=3, attempt_timeout=5.0, hedge=True)
+    POLLEN_POLICY = RetryPolicy(name='google_pollen', attempts=3, attempt_timeout=5.0, hedge=True)
+    
     def __init__(self):
         self.api_key = os.getenv('GOOGLE_MAPS_API_KEY')
         if not self.api_key:
@@ -14,8 +24,12 @@ class AllergyClient:
         
         self.air_quality_url = "https://airquality.googleapis.com/v1/currentConditions:lookup"
         self.pollen_url = "https://pollen.googleapis.com/v1/forecast:lookup"
+        self.air_quality_quota = quota_group('google_air_quality', self.api_key)
+        self.pollen_quota = quota_group('google_pollen', self.api_key)
 
-    @cached(ttl_seconds=300)  # Cache for 5 minutes
+    @cached(ttl_seconds=300, stale_while_revalidate=600, max_stale=1800)  # Fresh for 5 minutes, served stale while refreshing
+    @circuit_breaker('google_air_quality', is_failure=lambda result: result is None)
+    @rate_limited(max_requests=6000, time_window=60, group=lambda client, *args, **kwargs: client.air_quality_quota, adaptive=True)
     async def get_air_quality(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
         """
         Get current air quality conditions for a location.
@@ -37,14 +51,20 @@ class AllergyClient:
                 "languageCode": "en"
             }
             
-            async with httpx.AsyncClient() as client:
+            async def lookup():
+                client = get_client(self.air_quality_url)
                 response = await client.post(
                     f"{self.air_quality_url}?key={self.api_key}",
                     json=json_data,
-                    headers={'Content-Type': 'application/json'}
+                    headers={'Content-Type': 'application/json'},
+                    timeout=self.TIMEOUT
                 )
+                observe_response(self.air_quality_quota, response)
                 response.raise_for_status()
+                note_freshness(response)
                 return response.json()
+
+            return await self.AIR_QUALITY_POLICY.run(lookup)
                 
         except httpx.HTTPError as e:
             print(f"Error fetching air quality data: {e}")
@@ -53,7 +73,9 @@ class AllergyClient:
             print(f"Unexpected error fetching air quality data: {e}")
             return None
 
-    @cached(ttl_seconds=300)  # Cache for 5 minutes
+    @cached(ttl_seconds=300, stale_while_revalidate=600, max_stale=1800)  # Fresh for 5 minutes, served stale while refreshing
+    @circuit_breaker('google_pollen', is_failure=lambda result: result is None)
+    @rate_limited(max_requests=6000, time_window=60, group=lambda client, *args, **kwargs: client.pollen_quota, adaptive=True)
     async def get_pollen_forecast(self, latitude: float, longitude: float, days: int = 5) -> Optional[Dict[str, Any]]:
         """
         Get pollen forecast for a location.
@@ -79,13 +101,13 @@ class AllergyClient:
                 "plantsDescription": "true"  # Include detailed plant information
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    self.pollen_url,
-                    params=params
-                )
-                response.raise_for_status()
-                return response.json()
+            return await self.POLLEN_POLICY.run(lambda: conditional_get(
+                self.pollen_url,
+                lambda response: response.json(),
+                params=params,
+                timeout=self.TIMEOUT,
+                on_response=lambda response: observe_response(self.pollen_quota, response)
+            ))
                 
         except httpx.HTTPError as e:
             print(f"Error fetching pollen forecast: {e}")
@@ -4,13 +4,22 @@ import httpx
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from ..utils.cache import cached
-from ..utils.rate_limit import rate_limited
+from ..utils.rate_limit import rate_limited, quota_group, observe_response
+from ..utils.circuit_breaker import circuit_breaker
+from ..utils.http_cache import conditional_get
+from ..utils.resilience import RetryPolicy
 
 # Load environment variables
 load_dotenv('.env.local')
 
 class WeatherClient:
     BASE_URL = "https://api.tomorrow.io/v4"
+    TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+    # No hedging: duplicate requests would spend the 25-per-5-minutes quota
+    RETRY_POLICY = RetryPolicy(name='tomorrow_io', attempts=3, attempt_timeout=8.0)
+    # Shortest TTL taken from response headers, so both endpoints together
+    # stay well inside the quota whatever the upstream advertises
+    MIN_TTL = 120
     
     def __init__(self):
         self.api_key = os.getenv('TOMORROW_IO_API_KEY')
@@ -18,9 +27,12 @@ class WeatherClient:
             raise ValueError("TOMORROW_IO_API_KEY environment variable is required")
         
         self.base_url = "https://api.tomorrow.io/v4/weather"
+        # Every endpoint called with the same API key shares one quota
+        self.quota_group = quota_group('tomorrow_io', self.api_key)
 
-    @cached(ttl_seconds=300)  # Cache for 5 minutes
-    @rate_limited(max_requests=25, time_window=300)  # 25 requests per 5 minutes
+    @cached(ttl_seconds=300, stale_while_revalidate=600, max_stale=1800, unordered_args=('fields',))  # Fresh for 5 minutes, served stale while refreshing
+    @circuit_breaker('tomorrow_io')
+    @rate_limited(max_requests=25, time_window=300, group=lambda client, *args, **kwargs: client.quota_group, adaptive=True)  # 25 requests per 5 minutes
     async def get_realtime(
         self,
         location: Tuple[float, float],
@@ -58,17 +70,22 @@ class WeatherClient:
                 'units': units
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/realtime", params=params)
-                response.raise_for_status()
-                return response.json()
+            return await self.RETRY_POLICY.run(lambda: conditional_get(
+                f"{self.base_url}/realtime",
+                lambda response: response.json(),
+                params=params,
+                timeout=self.TIMEOUT,
+                on_response=lambda response: observe_response(self.quota_group, response),
+                min_ttl=self.MIN_TTL
+            ))
                 
         except Exception as e:
             print(f"Error fetching current weather: {e}")
             raise
 
-    @cached(ttl_seconds=300)  # Cache for 5 minutes
-    @rate_limited(max_requests=25, time_window=300)  # 25 requests per 5 minutes
+    @cached(ttl_seconds=300, stale_while_revalidate=600, max_stale=1800, unordered_args=('fields',))  # Fresh for 5 minutes, served stale while refreshing
+    @circuit_breaker('tomorrow_io')
+    @rate_limited(max_requests=25, time_window=300, group=lambda client, *args, **kwargs: client.quota_group, adaptive=True)  # 25 requests per 5 minutes
     async def get_forecast(
         self,
         location: Tuple[float, float],
@@ -109,15 +126,15 @@ class WeatherClient:
                 'units': units
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/timelines", params=params)
-                response.raise_for_status()
-                return response.json()
+            return await self.RETRY_POLICY.run(lambda: conditional_get(
+                f"{self.base_url}/timelines",
+                lambda response: response.json(),
+                params=params,
+                timeout=self.TIMEOUT,
+                on_response=lambda response: observe_response(self.quota_group, response),
+                min_ttl=self.MIN_TTL
+            ))
                 
         except Exception as e:
             print(f"Error fetching forecast: {e}")
             raise
-
-    async def __del__(self):
-        if hasattr(self, 'client'):
-            await self.client.aclose()